@@ -0,0 +1,676 @@
+"""Resumable batch runs over many structure files.
+
+Structure files are put on a durable ``WorkQueue`` and processed by worker processes, each
+writing one ``{stem}_{hash}_result.json`` per structure, like the single-file CLI but with a short
+hash of the queued path, so that files with the same name in different directories do not
+overwrite each other. Restarting a batch
+with the same queue file skips every structure that is already done; more workers (on this or
+other nodes) can join at any time by pointing at the same queue file.
+
+Workers can guard themselves against pathological structures: an up-front cost estimate
+(``moleculetda.cost``) routes structures with too many points to a separate "oversized" lane, to
+the tiled approximate mode, or straight to failure, and each structure can be computed in a child
+process with wall-time and resident memory limits, so a runaway structure never takes the worker
+down with it.
+
+Each worker overlaps I/O with compute: reader threads prefetch the next input files while the
+current structure is computed, and a background writer stores results (one JSON file per
+structure, or JSON lines shards batching many structures) and only then marks them as done.
+Every worker logs how long it computed and how long it waited for I/O.
+"""
+
+import hashlib
+import json
+import multiprocessing
+import os
+import queue
+import signal
+import socket
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union, cast
+
+from loguru import logger
+from pymatgen.core import Structure
+
+from .cost import estimate_cost
+from .io import NumpyEncoder, dump_json, read_json, read_jsonl
+from .structure_to_vectorization import structure_to_result
+from .workqueue import DEFAULT_LANE, PENDING, RUNNING, WorkQueue
+
+__all__ = [
+    "run_batch",
+    "run_worker",
+    "result_path",
+    "iter_results",
+    "ResourceLimitExceeded",
+    "OVERSIZED_LANE",
+]
+
+OVERSIZED_LANE = "oversized"
+
+
+class ResourceLimitExceeded(RuntimeError):
+    """Raised when computing a structure exceeds its wall time or memory limit."""
+
+
+def result_path(filename: Union[str, Path], output_dir: Union[str, Path]) -> Path:
+    """Path of the result file written for a structure file.
+
+    Args:
+        filename: Path of the structure file as it is queued (``run_batch`` queues absolute
+            paths).
+        output_dir: Directory the batch writes to.
+
+    Returns:
+        path of the result file, named after the stem of the structure file and the first eight
+        hex digits of the SHA-1 of its queued path
+    """
+    digest = hashlib.sha1(str(filename).encode()).hexdigest()[:8]
+    return Path(output_dir) / f"{Path(filename).stem}_{digest}_result.json"
+
+
+def iter_results(output_dir: Union[str, Path]) -> Iterator[Tuple[str, dict]]:
+    """Iterate over the results in an output directory, both single files and shards.
+
+    A worker that crashes after appending records to a shard but before marking them as done
+    leaves records that are computed and appended again by another worker. Such duplicate shard
+    records are yielded only once, the last one in the order of the shard files wins.
+
+    Args:
+        output_dir: Directory the batch wrote to.
+
+    Returns:
+        iterator of (key, result) pairs, where the key of a single file is the name of the result
+        file without "_result.json" (see ``result_path``) and the key of a shard record is the
+        queued path
+    """
+    output_dir = Path(output_dir)
+    for path in sorted(output_dir.glob("*_result.json")):
+        yield path.name[: -len("_result.json")], read_json(path)
+
+    shards = sorted(output_dir.glob("results_*.jsonl"))
+    # first pass: position of the last record of each key
+    last = {}
+    for i, path in enumerate(shards):
+        for j, record in enumerate(read_jsonl(path)):
+            last[record["key"]] = (i, j)
+    for i, path in enumerate(shards):
+        for j, record in enumerate(read_jsonl(path)):
+            if last[record["key"]] == (i, j):
+                yield record["key"], record["result"]
+
+
+def _descendants(pid: int) -> List[int]:
+    """A process and all of its descendants (Linux only, other systems only see the process)."""
+    pids, stack = [], [pid]
+    while stack:
+        current = stack.pop()
+        pids.append(current)
+        try:
+            for task in os.listdir(f"/proc/{current}/task"):
+                with open(f"/proc/{current}/task/{task}/children") as f:
+                    stack.extend(int(child) for child in f.read().split())
+        except OSError:
+            continue
+    return pids
+
+
+def _rss(pid: int) -> int:
+    """Resident memory in bytes of a process and its descendants, 0 if unavailable."""
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    total = 0
+    for current in _descendants(pid):
+        try:
+            with open(f"/proc/{current}/statm") as f:
+                total += int(f.read().split()[1]) * page_size
+        except (OSError, IndexError, ValueError):
+            continue
+    return total
+
+
+def _limited_target(conn, target, args):
+    try:
+        result = target(*args)
+    except Exception as e:
+        conn.send(("error", f"{type(e).__name__}: {e}"))
+    else:
+        conn.send(("ok", result))
+    finally:
+        conn.close()
+
+
+def _run_limited(
+    target, args, timeout: Optional[float] = None, max_memory: Optional[int] = None, poll=0.2
+):
+    """Run target(*args) in a child process, killing it when it exceeds a limit.
+
+    Args:
+        target: function to run
+        args: positional arguments of target
+        timeout: wall time limit in seconds
+        max_memory: limit on the resident memory of the child and its descendants in bytes
+        poll: seconds between checks of the limits
+
+    Returns:
+        the return value of target
+
+    Raises:
+        ResourceLimitExceeded: if the child was killed for exceeding a limit
+        RuntimeError: if target raised, with the type name and message of the exception
+    """
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.Process(target=_limited_target, args=(sender, target, args))
+    process.start()
+    # only None before start
+    child = cast(int, process.pid)
+    sender.close()
+    start = time.monotonic()
+    message = None
+    try:
+        while process.exitcode is None:
+            # the result has to be received before the child can exit if it fills the pipe
+            if receiver.poll(poll):
+                message = receiver.recv()
+                process.join()
+                break
+            if timeout and time.monotonic() - start > timeout:
+                raise ResourceLimitExceeded(f"exceeded wall time limit of {timeout}s")
+            if max_memory and _rss(child) > max_memory:
+                raise ResourceLimitExceeded(f"exceeded memory limit of {max_memory} bytes")
+    finally:
+        if process.exitcode is None:
+            for pid in reversed(_descendants(child)):
+                try:
+                    os.kill(pid, signal.SIGKILL)
+                except OSError:
+                    pass
+            process.join()
+
+    if message is None and receiver.poll():
+        message = receiver.recv()
+    receiver.close()
+    if message is not None:
+        status, value = message
+        if status == "error":
+            raise RuntimeError(value)
+        return value
+    if process.exitcode == -signal.SIGKILL:
+        raise ResourceLimitExceeded("killed by SIGKILL, most likely out of memory")
+    raise RuntimeError(f"worker process exited with code {process.exitcode}")
+
+
+def _read_input(key: str) -> Optional[str]:
+    """Contents of a CIF file, None for inputs that are read while computing."""
+    if Path(key).suffix != ".cif":
+        return None
+    with open(key) as f:
+        return f.read()
+
+
+def _process(key: str, structure: Optional[Structure], options: dict) -> dict:
+    """Compute the result of one structure."""
+    return structure_to_result(key, structure=structure, **options)
+
+
+def _keep_alive(
+    queue_path: str, held: set, lock: threading.Lock, lease: float, stop: threading.Event
+):
+    """Renew the leases of the items a worker holds until they are written."""
+    work_queue = WorkQueue(queue_path, lease=lease)
+    try:
+        while not stop.wait(lease / 3):
+            with lock:
+                keys = list(held)
+            work_queue.heartbeat(keys)
+    finally:
+        work_queue.close()
+
+
+class _ResultWriter(threading.Thread):
+    """Writes results in the background and marks them as done once they are on disk.
+
+    Args:
+        queue_path: SQLite file of the work queue.
+        output_dir: Directory where results are written.
+        worker_id: Name of the worker, used in the names of shard and temporary files.
+        release: Called with the keys whose results were stored (or failed to be stored).
+        depth: Number of results waiting to be written before the worker blocks.
+        shard_size: Number of results per JSON lines shard, None to write one JSON file each.
+        flush_every: Number of results after which a shard is flushed to disk.
+        flush_interval: Seconds after which waiting results are flushed even if fewer.
+    """
+
+    def __init__(
+        self,
+        queue_path,
+        output_dir,
+        worker_id: str,
+        release,
+        depth: int = 16,
+        shard_size: Optional[int] = None,
+        flush_every: int = 64,
+        flush_interval: float = 30.0,
+    ):
+        super().__init__(daemon=True)
+        self.results: "queue.Queue[Optional[Tuple[str, dict]]]" = queue.Queue(maxsize=max(depth, 1))
+        self.queue_path = str(queue_path)
+        self.output_dir = Path(output_dir)
+        self.worker_id = worker_id
+        self.release = release
+        self.shard_size = shard_size
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.write_time = 0.0
+        self.n_done = 0
+        self.error: Optional[BaseException] = None
+
+    def put(self, item, poll: float = 1.0):
+        """Queue a (key, result) pair, or None to stop, without blocking on a dead writer.
+
+        Raises:
+            RuntimeError: if the writer stopped because of an error, chained to that error
+        """
+        while True:
+            if not self.is_alive():
+                raise RuntimeError("The result writer stopped") from self.error
+            try:
+                self.results.put(item, timeout=poll)
+                return
+            except queue.Full:
+                continue
+
+    def run(self):
+        try:
+            self._run()
+        except BaseException as e:
+            logger.exception("The result writer stopped")
+            self.error = e
+
+    def _run(self):
+        work_queue = WorkQueue(self.queue_path)
+        shard, n_shards, n_in_shard = None, 0, 0
+        unflushed = []
+
+        def flush():
+            if shard is not None and unflushed:
+                shard.flush()
+                os.fsync(shard.fileno())
+                work_queue.complete(unflushed)
+                self.release(unflushed)
+                self.n_done += len(unflushed)
+                unflushed.clear()
+
+        try:
+            while True:
+                try:
+                    item = self.results.get(timeout=self.flush_interval)
+                except queue.Empty:
+                    start = time.perf_counter()
+                    flush()
+                    self.write_time += time.perf_counter() - start
+                    continue
+                if item is None:
+                    break
+
+                key, result = item
+                start = time.perf_counter()
+                try:
+                    if self.shard_size:
+                        if shard is None or n_in_shard >= self.shard_size:
+                            flush()
+                            if shard is not None:
+                                shard.close()
+                            n_shards += 1
+                            name = f"results_{self.worker_id}_{n_shards:05d}.jsonl"
+                            shard, n_in_shard = open(self.output_dir / name, "a"), 0
+                        record = json.dumps({"key": key, "result": result}, cls=NumpyEncoder)
+                        shard.write(record + "\n")
+                        n_in_shard += 1
+                        unflushed.append(key)
+                        if len(unflushed) >= self.flush_every:
+                            flush()
+                    else:
+                        path = result_path(key, self.output_dir)
+                        # write then rename so that a crash never leaves a truncated result
+                        tmp_path = path.with_name(f".{path.name}.{self.worker_id}.tmp")
+                        dump_json(result, tmp_path)
+                        os.replace(tmp_path, path)
+                        work_queue.complete([key])
+                        self.release([key])
+                        self.n_done += 1
+                except Exception as e:
+                    logger.exception(f"Failed to write the result of {key}")
+                    work_queue.fail(key, repr(e))
+                    self.release([key])
+                self.write_time += time.perf_counter() - start
+        finally:
+            flush()
+            if shard is not None:
+                shard.close()
+            work_queue.close()
+
+
+def _claim(work_queue, worker_id, lane, window, inflight, held, lock, readers):
+    """Claim items until the read-ahead window is full, submitting them to the readers."""
+    while len(inflight) < window:
+        keys = work_queue.claim(worker_id, n=window - len(inflight), lane=lane)
+        if not keys:
+            return
+        with lock:
+            held.update(keys)
+        for key in keys:
+            inflight.append((key, readers.submit(_read_input, key) if readers else None))
+
+
+def _check_oversized(oversized: str, oversized_tile_radius: Optional[float]):
+    if oversized not in ("defer", "tile", "fail"):
+        raise ValueError(f'Unknown oversized mode "{oversized}".')
+    if oversized == "tile" and not oversized_tile_radius:
+        raise ValueError('The "tile" mode for oversized structures needs oversized_tile_radius.')
+
+
+def _item_options(
+    work_queue, key, structure, options, max_points, oversized, oversized_tile_radius
+) -> Optional[dict]:
+    """Options to compute an item with, None if it was moved or failed as oversized."""
+    size = options.get("supercell_size")
+    try:
+        estimate = estimate_cost(key, size=size, supercell=bool(size), structure=structure)
+    except Exception as e:
+        logger.exception(f"Failed to estimate the cost of {key}")
+        work_queue.fail(key, repr(e))
+        return None
+    if estimate.n_points <= max_points:
+        return options
+    logger.info(f"{key} is oversized: {estimate}")
+    if oversized == "defer":
+        work_queue.move(key, OVERSIZED_LANE)
+        return None
+    if oversized == "fail":
+        work_queue.fail(key, f"oversized: {estimate}")
+        return None
+    return {**options, "tile_radius": oversized_tile_radius}
+
+
+def _compute_item(work_queue, key, args, timeout, max_memory, lane, oversized) -> Optional[dict]:
+    """Result of an item, None if it was moved or failed."""
+    try:
+        if timeout or max_memory:
+            return _run_limited(_process, args, timeout=timeout, max_memory=max_memory)
+        return _process(*args)
+    except ResourceLimitExceeded as e:
+        logger.warning(f"{key}: {e}")
+        if lane == DEFAULT_LANE and oversized == "defer":
+            work_queue.move(key, OVERSIZED_LANE)
+        else:
+            work_queue.fail(key, str(e))
+    except Exception as e:
+        logger.exception(f"Failed to process {key}")
+        work_queue.fail(key, repr(e))
+    return None
+
+
+def run_worker(
+    queue_path: Union[str, Path],
+    output_dir: Union[str, Path],
+    options: Optional[dict] = None,
+    worker_id: Optional[str] = None,
+    lease: float = 3600.0,
+    lane: str = DEFAULT_LANE,
+    timeout: Optional[float] = None,
+    max_memory: Optional[int] = None,
+    max_points: Optional[int] = None,
+    oversized: str = "defer",
+    oversized_tile_radius: Optional[float] = None,
+    prefetch: int = 4,
+    n_readers: int = 2,
+    write_depth: int = 16,
+    shard_size: Optional[int] = None,
+    flush_every: int = 64,
+) -> Dict[str, float]:
+    """Process items from the queue until it is empty.
+
+    Args:
+        queue_path: SQLite file of the work queue.
+        output_dir: Directory where result files are written.
+        options: Keyword arguments for ``structure_to_result``.
+        worker_id: Name of the worker recorded in the queue, defaults to host and process id.
+        lease: Seconds without a heartbeat after which an item is handed to another worker.
+        lane: Lane of the queue to take items from, e.g. "oversized" on big-memory nodes.
+        timeout: Wall time limit in seconds for each structure.
+        max_memory: Limit on the resident memory in bytes used for each structure.
+        max_points: Structures estimated to have more points are treated as oversized;
+            only checked in the default lane.
+        oversized: What to do with oversized structures, or structures exceeding a limit in the
+            default lane: "defer" moves them to the "oversized" lane, "tile" computes them in the
+            tiled approximate mode (oversized structures only), "fail" marks them as failed.
+        oversized_tile_radius: Tile radius of the "tile" mode, required by it. Tiles are about
+            4 times as wide, so it has to be well below the size of the oversized structures.
+        prefetch: Number of input files claimed and read ahead of the computation,
+            0 to read each file right before computing it.
+        n_readers: Number of threads reading input files.
+        write_depth: Number of computed results waiting for the writer before the worker blocks.
+        shard_size: If given, results are appended to JSON lines files holding this many
+            structures each (see ``iter_results``) instead of one JSON file per structure.
+        flush_every: Number of results after which a shard is flushed and marked as done.
+
+    Returns:
+        Dict with the number of completed items ("done") and the seconds spent computing
+        ("compute"), waiting for input files or the writer ("io_wait") and writing in the
+        background ("write")
+    """
+    _check_oversized(oversized, oversized_tile_radius)
+    options = options or {}
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    work_queue = WorkQueue(queue_path, lease=lease)
+
+    # items claimed by this worker whose results are not stored yet
+    held: Set[str] = set()
+    lock = threading.Lock()
+
+    def release(keys):
+        with lock:
+            held.difference_update(keys)
+
+    stop = threading.Event()
+    heartbeat = threading.Thread(
+        target=_keep_alive, args=(str(queue_path), held, lock, lease, stop), daemon=True
+    )
+    writer = _ResultWriter(
+        queue_path,
+        output_dir,
+        worker_id,
+        release,
+        depth=write_depth,
+        shard_size=shard_size,
+        flush_every=flush_every,
+    )
+    readers = ThreadPoolExecutor(max_workers=n_readers) if prefetch else None
+    inflight: Deque[Tuple[str, Optional[Future]]] = deque()
+    compute_time, io_wait = 0.0, 0.0
+    heartbeat.start()
+    writer.start()
+    try:
+        while True:
+            _claim(work_queue, worker_id, lane, max(prefetch, 1), inflight, held, lock, readers)
+            if not inflight:
+                break
+            key, future = inflight.popleft()
+
+            start = time.perf_counter()
+            try:
+                text = future.result() if future else _read_input(key)
+                io_wait += time.perf_counter() - start
+                start = time.perf_counter()
+                structure = Structure.from_str(text, fmt="cif") if text is not None else None
+            except Exception as e:
+                logger.exception(f"Failed to read {key}")
+                work_queue.fail(key, repr(e))
+                release([key])
+                continue
+
+            item_options: Optional[dict] = options
+            if max_points and lane == DEFAULT_LANE:
+                item_options = _item_options(
+                    work_queue,
+                    key,
+                    structure,
+                    options,
+                    max_points,
+                    oversized,
+                    oversized_tile_radius,
+                )
+            result = None
+            if item_options is not None:
+                args = (key, structure, item_options)
+                result = _compute_item(work_queue, key, args, timeout, max_memory, lane, oversized)
+            compute_time += time.perf_counter() - start
+            if result is None:
+                release([key])
+                continue
+
+            start = time.perf_counter()
+            writer.put((key, result))
+            io_wait += time.perf_counter() - start
+    finally:
+        if writer.is_alive():
+            writer.put(None)
+        writer.join()
+        stop.set()
+        heartbeat.join()
+        if readers:
+            readers.shutdown()
+        work_queue.close()
+    if writer.error is not None:
+        raise RuntimeError("The result writer stopped") from writer.error
+
+    stats = {
+        "done": writer.n_done,
+        "compute": compute_time,
+        "io_wait": io_wait,
+        "write": writer.write_time,
+    }
+    logger.info(
+        f"Worker {worker_id} completed {stats['done']} items: {compute_time:.1f}s computing, "
+        f"{io_wait:.1f}s waiting for I/O, {writer.write_time:.1f}s writing in the background"
+    )
+    return stats
+
+
+def _worker_main(stats: multiprocessing.Queue, args: tuple, kwargs: dict):
+    stats.put(run_worker(*args, **kwargs))
+
+
+def run_batch(
+    filenames: Iterable[Union[str, Path]],
+    queue_path: Union[str, Path],
+    output_dir: Union[str, Path] = ".",
+    n_workers: int = 1,
+    retry_failed: bool = False,
+    lease: float = 3600.0,
+    lane: str = DEFAULT_LANE,
+    timeout: Optional[float] = None,
+    max_memory: Optional[int] = None,
+    max_points: Optional[int] = None,
+    oversized: str = "defer",
+    oversized_tile_radius: Optional[float] = None,
+    prefetch: int = 4,
+    n_readers: int = 2,
+    write_depth: int = 16,
+    shard_size: Optional[int] = None,
+    flush_every: int = 64,
+    **options,
+) -> Tuple[Dict[str, int], List[Dict[str, float]]]:
+    """Queue structure files and process them with a pool of worker processes.
+
+    Args:
+        filenames: Structure files to process, added to the queue unless already there.
+        queue_path: SQLite file of the work queue, reused across restarts.
+        output_dir: Directory where result files are written.
+        n_workers: Number of worker processes on this node.
+        retry_failed: If True, put structures that failed in an earlier run back on the queue.
+        lease: Seconds without a heartbeat after which an item is handed to another worker.
+        lane: Lane of the queue that new files are added to and that workers take items from.
+        timeout: Wall time limit in seconds for each structure.
+        max_memory: Limit on the resident memory in bytes used for each structure.
+        max_points: Structures estimated to have more points are treated as oversized.
+        oversized: What to do with oversized structures: "defer", "tile" or "fail",
+            see ``run_worker``.
+        oversized_tile_radius: Tile radius used for oversized structures, required by the "tile"
+            mode.
+        prefetch: Number of input files each worker reads ahead of the computation.
+        n_readers: Number of threads reading input files in each worker.
+        write_depth: Number of results waiting for the background writer of each worker.
+        shard_size: If given, results are written to JSON lines shards of this many structures.
+        flush_every: Number of results after which a shard is flushed and marked as done.
+        **options: Keyword arguments for ``structure_to_result``.
+
+    Returns:
+        number of queue items per status in the lane after all local workers finished, and the
+        statistics returned by ``run_worker`` for each local worker that finished cleanly
+    """
+    _check_oversized(oversized, oversized_tile_radius)
+    worker_options: Dict[str, Any] = {
+        "lease": lease,
+        "lane": lane,
+        "timeout": timeout,
+        "max_memory": max_memory,
+        "max_points": max_points,
+        "oversized": oversized,
+        "oversized_tile_radius": oversized_tile_radius,
+        "prefetch": prefetch,
+        "n_readers": n_readers,
+        "write_depth": write_depth,
+        "shard_size": shard_size,
+        "flush_every": flush_every,
+    }
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+    work_queue = WorkQueue(queue_path, lease=lease)
+    try:
+        # absolute paths, so that workers on other nodes agree on the keys
+        n_added = work_queue.add((str(Path(f).resolve()) for f in filenames), lane=lane)
+        if retry_failed:
+            work_queue.reset()
+        logger.info(f"Added {n_added} items to {queue_path}: {work_queue.counts(lane)}")
+    finally:
+        work_queue.close()
+
+    args = (queue_path, output_dir, options)
+    if n_workers == 1:
+        stats = [run_worker(*args, **worker_options)]
+    else:
+        stats_queue: multiprocessing.Queue = multiprocessing.Queue()
+        workers = [
+            multiprocessing.Process(target=_worker_main, args=(stats_queue, args, worker_options))
+            for _ in range(n_workers)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        stats = []
+        while True:
+            try:
+                stats.append(stats_queue.get(timeout=0.1))
+            except queue.Empty:
+                break
+        if len(stats) < n_workers:
+            logger.warning(
+                f"{n_workers - len(stats)} of {n_workers} workers did not finish cleanly"
+            )
+
+    work_queue = WorkQueue(queue_path, lease=lease)
+    try:
+        counts = work_queue.counts(lane)
+        n_oversized = work_queue.counts(OVERSIZED_LANE)[PENDING] if lane != OVERSIZED_LANE else 0
+    finally:
+        work_queue.close()
+    if counts[RUNNING]:
+        logger.warning(f"{counts[RUNNING]} items are still held by other workers")
+    if n_oversized:
+        logger.warning(f'{n_oversized} oversized items are waiting in the "{OVERSIZED_LANE}" lane')
+    return counts, stats
@@ -1,76 +1,317 @@
-from ast import dump
 from pathlib import Path
 
 import click
 from loguru import logger
 
-from .construct_pd import construct_pds
+from .batch import run_batch
 from .io import dump_json
-from .read_file import read_data
-from .vectorize_pds import diagrams_to_arrays, pd_vectorization
+from .server import serve as run_server
+from .structure_to_vectorization import structure_to_result
+from .workqueue import DEFAULT_LANE
+
+
+def vectorization_options(func):
+    """Options shared by every command that computes persistence diagrams and images."""
+    options = [
+        click.option(
+            "--supercell-size",
+            "-s",
+            default=None,
+            help="Size of supercell. Use if wanting all systems to be a certain cubic size. Only works if lattice constants exist.",
+            type=click.INT,
+        ),
+        click.option(
+            "--spread",
+            "-sp",
+            default=0.15,
+            help="Gaussian spread for vectorizing persistence diagram transformation.",
+            type=click.FLOAT,
+        ),
+        click.option(
+            "--maxB",
+            "maxB",
+            default=18,
+            help="Maximum birth value for persistence diagram vectorization.",
+            type=click.FLOAT,
+        ),
+        click.option(
+            "--maxP",
+            "maxP",
+            default=18,
+            help="Maximum persistence value for persistence diagram vectorization.",
+            type=click.FLOAT,
+        ),
+        click.option(
+            "--minB",
+            "minB",
+            default=0,
+            help="Minimum birth value for persistence diagram vectorization.",
+            type=click.FLOAT,
+        ),
+        click.option(
+            "--image-method",
+            default="exact",
+            help="Render persistence images exactly or with the faster histogram approximation.",
+            type=click.Choice(["exact", "histogram"]),
+        ),
+        click.option(
+            "--precision",
+            default=None,
+            help="Exact or fast (inexact) alpha shapes, or auto to choose by the number of points. "
+            "Defaults to exact, except for unweighted periodic alpha shapes.",
+            type=click.Choice(["exact", "fast", "auto"]),
+        ),
+        click.option(
+            "--tile-radius",
+            default=None,
+            help="Split the point cloud into overlapping tiles resolving features up to this radius.",
+            type=click.FLOAT,
+        ),
+        click.option(
+            "--n-jobs",
+            "-j",
+            default=None,
+            help="Number of worker processes used for tiling. Defaults to the number of CPUs.",
+            type=click.INT,
+        ),
+    ]
+    for option in reversed(options):
+        func = option(func)
+    return func
 
 
 @click.command("cli")
 @click.argument("filename", type=click.Path(exists=True))
+@vectorization_options
+def main(
+    filename, supercell_size, spread, maxB, maxP, minB, image_method, precision, tile_radius, n_jobs
+):
+    """
+    Convert a molecule/structurefile to vecotrized persistence diagrams.
+    """
+    file = Path(filename)
+    result = structure_to_result(
+        file,
+        supercell_size=supercell_size,
+        spread=spread,
+        maxB=maxB,
+        maxP=maxP,
+        minB=minB,
+        image_method=image_method,
+        precision=precision,
+        tile_radius=tile_radius,
+        n_jobs=n_jobs,
+    )
+    dump_json(result, f"{file.stem}_result.json")
+
+
+@click.command("batch")
+@click.argument("filenames", nargs=-1, type=click.Path(exists=True))
+@click.option(
+    "--queue",
+    "-q",
+    "queue_path",
+    required=True,
+    help="SQLite work queue file. Reuse it to resume a batch or to add workers on other nodes.",
+    type=click.Path(),
+)
 @click.option(
-    "--supercell-size",
-    "-s",
+    "--file-list",
     default=None,
-    help="Size of supercell. Use if wanting all systems to be a certain cubic size. Only works if lattice constants exist.",
+    help="Text file with one structure file per line, added to the queue.",
+    type=click.Path(exists=True),
+)
+@click.option(
+    "--output-dir",
+    "-o",
+    default=".",
+    help="Directory where the result files are written.",
+    type=click.Path(),
+)
+@click.option(
+    "--workers",
+    "-w",
+    default=1,
+    help="Number of worker processes on this node.",
     type=click.INT,
 )
 @click.option(
-    "--spread",
-    "-sp",
-    default=0.15,
-    help="Gaussian spread for vectorizing persistence diagram transformation.",
+    "--retry-failed",
+    is_flag=True,
+    help="Put structures that failed in an earlier run back on the queue.",
+)
+@click.option(
+    "--lease",
+    default=3600.0,
+    help="Seconds without a heartbeat after which a structure is handed to another worker.",
     type=click.FLOAT,
 )
 @click.option(
-    "--maxB",
-    default=18,
-    help="Maximum birth value for persistence diagram vectorization.",
+    "--lane",
+    default=DEFAULT_LANE,
+    help='Lane of the queue to work on, e.g. "oversized" on big-memory nodes.',
+    type=click.STRING,
+)
+@click.option(
+    "--timeout",
+    default=None,
+    help="Wall time limit in seconds for each structure.",
     type=click.FLOAT,
 )
 @click.option(
-    "--maxP",
-    default=18,
-    help="Maximum persistence value for persistence diagram vectorization.",
+    "--max-memory",
+    default=None,
+    help="Resident memory limit in MB for each structure.",
     type=click.FLOAT,
 )
 @click.option(
-    "--minB",
-    default=0,
-    help="Minimum birth value for persistence diagram vectorization.",
+    "--max-points",
+    default=None,
+    help="Structures estimated to have more points than this are treated as oversized.",
+    type=click.INT,
+)
+@click.option(
+    "--oversized",
+    default="defer",
+    help="Defer oversized structures to the oversized lane, compute them tiled, or fail them.",
+    type=click.Choice(["defer", "tile", "fail"]),
+)
+@click.option(
+    "--oversized-tile-radius",
+    default=None,
+    help="Tile radius used for oversized structures, required by --oversized tile.",
     type=click.FLOAT,
 )
-def main(filename, supercell_size, spread, maxB, maxP, minB):
+@click.option(
+    "--prefetch",
+    default=4,
+    help="Number of input files each worker reads ahead of the computation.",
+    type=click.INT,
+)
+@click.option("--readers", default=2, help="Number of threads reading input files.", type=click.INT)
+@click.option(
+    "--write-depth",
+    default=16,
+    help="Number of results waiting for the background writer before a worker blocks.",
+    type=click.INT,
+)
+@click.option(
+    "--shard-size",
+    default=None,
+    help="Write results to JSON lines shards of this many structures instead of one file each.",
+    type=click.INT,
+)
+@click.option(
+    "--flush-every",
+    default=64,
+    help="Number of results after which a shard is flushed to disk.",
+    type=click.INT,
+)
+@vectorization_options
+def batch(
+    filenames,
+    queue_path,
+    file_list,
+    output_dir,
+    workers,
+    retry_failed,
+    lease,
+    lane,
+    timeout,
+    max_memory,
+    max_points,
+    oversized,
+    oversized_tile_radius,
+    prefetch,
+    readers,
+    write_depth,
+    shard_size,
+    flush_every,
+    **options,
+):
     """
-    Convert a molecule/structurefile to vecotrized persistence diagrams.
+    Convert many molecule/structure files, skipping the ones finished in earlier runs.
     """
-    file = Path(filename)
-    sc = True if supercell_size else False
-    coords = read_data(file, size=supercell_size, supercell=sc)
-    dgms = construct_pds(coords)
+    filenames = list(filenames)
+    if file_list:
+        with open(file_list) as f:
+            filenames.extend(line.strip() for line in f if line.strip())
 
-    np_dgms = diagrams_to_arrays(dgms)
-
-    images = []
-    for dim in [0, 1, 2, 3]:
-        dgm = np_dgms[f"dim{dim}"]
-        images.append(
-            pd_vectorization(
-                dgm,
-                spread=spread,
-                weighting="identity",
-                pixels=[50, 50],
-                specs={"maxB": maxB, "maxP": maxP, "minBD": minB},
-            )
+    counts, stats = run_batch(
+        filenames,
+        queue_path,
+        output_dir=output_dir,
+        n_workers=workers,
+        retry_failed=retry_failed,
+        lease=lease,
+        lane=lane,
+        timeout=timeout,
+        max_memory=int(max_memory * 2**20) if max_memory else None,
+        max_points=max_points,
+        oversized=oversized,
+        oversized_tile_radius=oversized_tile_radius,
+        prefetch=prefetch,
+        n_readers=readers,
+        write_depth=write_depth,
+        shard_size=shard_size,
+        flush_every=flush_every,
+        **options,
+    )
+    logger.info(f"Batch finished: {counts}")
+    if stats:
+        logger.info(
+            f"{sum(s['done'] for s in stats)} items completed by {len(stats)} workers: "
+            f"{sum(s['compute'] for s in stats):.1f}s computing, "
+            f"{sum(s['io_wait'] for s in stats):.1f}s waiting for I/O"
         )
 
-    result = {
-        "diagrams": np_dgms,
-        "images": images,
-    }
 
-    dump_json(result, f"{file.stem}_result.json")
+@click.command("serve")
+@click.option("--host", default="127.0.0.1", help="Address to listen on.", type=click.STRING)
+@click.option("--port", "-p", default=8765, help="Port to listen on.", type=click.INT)
+@click.option(
+    "--workers",
+    "-w",
+    default=None,
+    help="Number of warm worker processes. Defaults to the number of CPUs.",
+    type=click.INT,
+)
+@click.option(
+    "--cache-size",
+    default=1024,
+    help="Number of results kept in the in-memory LRU cache.",
+    type=click.INT,
+)
+def serve(host, port, workers, cache_size):
+    """
+    Serve persistence diagrams and images from warm worker processes on localhost.
+    """
+    run_server(host=host, port=port, n_workers=workers, cache_size=cache_size)
+
+
+@click.command("plot")
+@click.argument("sources", nargs=-1, required=True, type=click.Path(exists=True))
+@click.option("--output-dir", "-o", default=".", help="Directory for the plots.", type=click.Path())
+@click.option("--bins", default=200, help="Number of bins along each axis.", type=click.INT)
+@click.option("--maxB", "maxB", default=18, help="Maximum birth of the plots.", type=click.FLOAT)
+@click.option(
+    "--maxP", "maxP", default=18, help="Maximum persistence of the plots.", type=click.FLOAT
+)
+@click.option("--minB", "minB", default=0, help="Minimum birth of the plots.", type=click.FLOAT)
+def plot(sources, output_dir, bins, maxB, maxP, minB):
+    """
+    Plot the density of diagram points and the mean images of many results, e.g. a batch output
+    directory, without displaying anything.
+    """
+    # matplotlib is an optional dependency, only needed here
+    from .plotting import plot_dataset
+
+    plot_dataset(
+        sources,
+        output_dir,
+        bins=(bins, bins),
+        max_birth=maxB,
+        max_persistence=maxP,
+        min_birth=minB,
+    )
+    logger.info(f"Wrote plots to {output_dir}")
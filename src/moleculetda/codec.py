@@ -0,0 +1,216 @@
+"""Compact storage of persistence diagrams.
+
+``diagrams_to_arrays`` keeps 12 bytes per point and JSON roughly 40 characters. The codec stores
+births and persistences as fixed-point integers at a chosen resolution, sorts the points by
+birth, stores the birth differences and persistences in the narrowest integer type that fits,
+split into byte planes, and compresses everything with zlib.
+
+Maximum error of a decoded point with finite birth and death, at resolution ``res``:
+    birth: res / 2
+    persistence (death - birth): res / 2
+    death: res
+on top of rounding the decoded values to float32, like ``diagrams_to_arrays``. Points with a
+non-finite birth or death (e.g. the essential class in dimension 0) are stored exactly. The
+``data`` field is stored exactly or dropped (decoded as 0).
+
+Decoded diagrams are sorted by birth, then persistence; points that are not finite come last.
+"""
+
+import struct
+import zlib
+from typing import Dict, Type
+
+import numpy as np
+
+from .vectorize_pds import DGM_DTYPE
+
+__all__ = ["encode_diagram", "decode_diagram", "encode_diagrams", "decode_diagrams"]
+
+_MAGIC = b"MTDC"
+_ARCHIVE_MAGIC = b"MTDA"
+_VERSION = 1
+# magic, version, resolution, finite points, other points, has data, birth width,
+# persistence width, first birth, smallest persistence
+_HEADER = struct.Struct("<4sBdIIBBBqq")
+_WIDTHS: Dict[int, Type[np.unsignedinteger]] = {
+    1: np.uint8,
+    2: np.uint16,
+    4: np.uint32,
+    8: np.uint64,
+}
+# quantized values stay well inside int64
+_MAX_QUANTIZED = 2**62
+
+
+def _narrow(values: np.ndarray) -> np.ndarray:
+    """Non-negative integers in the narrowest unsigned type that holds them."""
+    top = int(values.max()) if len(values) else 0
+    for dtype in _WIDTHS.values():
+        if top <= np.iinfo(dtype).max:
+            return values.astype(dtype)
+    raise ValueError("Values do not fit in 64 bits.")
+
+
+def _to_planes(values: np.ndarray) -> bytes:
+    """Bytes of an array grouped by significance, which compresses better."""
+    return (
+        values.astype(values.dtype.newbyteorder("<"))
+        .view(np.uint8)
+        .reshape(len(values), values.itemsize)
+        .T.tobytes()
+    )
+
+
+def _from_planes(buffer: bytes, offset: int, n: int, width: int) -> np.ndarray:
+    planes = np.frombuffer(buffer, dtype=np.uint8, count=n * width, offset=offset)
+    values = np.ascontiguousarray(planes.reshape(width, n).T)
+    return values.view(np.dtype(_WIDTHS[width]).newbyteorder("<")).ravel()
+
+
+def encode_diagram(
+    dgm: np.ndarray, resolution: float = 1e-3, keep_data: bool = True, level: int = 6
+) -> bytes:
+    """Encode one persistence diagram.
+
+    Args:
+        dgm (np.ndarray): persistence diagram as returned by ``diagrams_to_arrays``
+        resolution (float): quantization step of births and persistences, see the module
+            docstring for the resulting maximum error
+        keep_data (bool): if False, the ``data`` field is not stored
+        level (int): zlib compression level
+
+    Returns:
+        encoded diagram
+    """
+    if resolution <= 0:
+        raise ValueError("The resolution has to be positive.")
+    dgm = np.asarray(dgm, dtype=DGM_DTYPE).ravel()
+    birth = dgm["birth"].astype(np.float64)
+    death = dgm["death"].astype(np.float64)
+    finite = np.isfinite(birth) & np.isfinite(death)
+    other = dgm[~finite]
+
+    q_birth = np.round(birth[finite] / resolution)
+    q_pers = np.round((death[finite] - birth[finite]) / resolution)
+    if len(q_birth) and max(np.abs(q_birth).max(), np.abs(q_pers).max()) >= _MAX_QUANTIZED:
+        raise ValueError(f"Resolution {resolution} is too fine for values of this size.")
+    q_birth, q_pers = q_birth.astype(np.int64), q_pers.astype(np.int64)
+    data = dgm["data"][finite]
+
+    order = np.lexsort((q_pers, q_birth))
+    q_birth, q_pers, data = q_birth[order], q_pers[order], data[order]
+    first_birth = int(q_birth[0]) if len(q_birth) else 0
+    min_pers = int(q_pers.min()) if len(q_pers) else 0
+    birth_steps = _narrow(np.diff(q_birth))
+    pers = _narrow(q_pers - min_pers)
+
+    body = [_to_planes(birth_steps), _to_planes(pers)]
+    if keep_data:
+        body.append(_to_planes(data))
+    body.append(other.astype(DGM_DTYPE.newbyteorder("<")).tobytes())
+
+    header = _HEADER.pack(
+        _MAGIC,
+        _VERSION,
+        resolution,
+        len(q_birth),
+        len(other),
+        keep_data,
+        birth_steps.itemsize,
+        pers.itemsize,
+        first_birth,
+        min_pers,
+    )
+    return header + zlib.compress(b"".join(body), level)
+
+
+def decode_diagram(blob: bytes) -> np.ndarray:
+    """Decode a persistence diagram written by ``encode_diagram``.
+
+    Args:
+        blob (bytes): encoded diagram
+
+    Returns:
+        persistence diagram with the dtype of ``diagrams_to_arrays``
+    """
+    (
+        magic,
+        version,
+        resolution,
+        n_finite,
+        n_other,
+        has_data,
+        birth_width,
+        pers_width,
+        first_birth,
+        min_pers,
+    ) = _HEADER.unpack_from(blob)
+    if magic != _MAGIC or version != _VERSION:
+        raise ValueError("Not an encoded persistence diagram.")
+    body = zlib.decompress(blob[_HEADER.size :])
+
+    offset = 0
+    birth_steps = _from_planes(body, offset, max(n_finite - 1, 0), birth_width)
+    offset += birth_steps.nbytes
+    pers = _from_planes(body, offset, n_finite, pers_width)
+    offset += pers.nbytes
+    dgm = np.empty(n_finite + n_other, dtype=DGM_DTYPE)
+    if has_data:
+        data = _from_planes(body, offset, n_finite, 4)
+        offset += data.nbytes
+        dgm["data"][:n_finite] = data
+    else:
+        dgm["data"][:n_finite] = 0
+    dgm[n_finite:] = np.frombuffer(
+        body, dtype=DGM_DTYPE.newbyteorder("<"), count=n_other, offset=offset
+    )
+
+    q_birth = np.empty(n_finite, dtype=np.int64)
+    if n_finite:
+        q_birth[0] = first_birth
+        np.cumsum(birth_steps.astype(np.int64), out=q_birth[1:])
+        q_birth[1:] += first_birth
+    birth = q_birth * resolution
+    dgm["birth"][:n_finite] = birth
+    dgm["death"][:n_finite] = birth + (pers.astype(np.int64) + min_pers) * resolution
+    return dgm
+
+
+def encode_diagrams(dgms: Dict[str, np.ndarray], resolution: float = 1e-3, **kwargs) -> bytes:
+    """Encode the persistence diagrams of all dimensions into one archive.
+
+    Args:
+        dgms (dict): persistence diagrams as returned by ``diagrams_to_arrays``
+        resolution (float): quantization step, see ``encode_diagram``
+        **kwargs: further arguments of ``encode_diagram``
+
+    Returns:
+        encoded diagrams
+    """
+    parts = [_ARCHIVE_MAGIC, struct.pack("<I", len(dgms))]
+    for name, dgm in dgms.items():
+        blob = encode_diagram(dgm, resolution=resolution, **kwargs)
+        key = name.encode()
+        parts += [struct.pack("<HQ", len(key), len(blob)), key, blob]
+    return b"".join(parts)
+
+
+def decode_diagrams(blob: bytes) -> Dict[str, np.ndarray]:
+    """Decode persistence diagrams written by ``encode_diagrams``.
+
+    Returns:
+        Dict where persistence diagrams for each dimension can be accessed via 'dim1', etc.
+    """
+    if blob[:4] != _ARCHIVE_MAGIC:
+        raise ValueError("Not an archive of encoded persistence diagrams.")
+    (n,) = struct.unpack_from("<I", blob, 4)
+    offset = 8
+    dgms = {}
+    for _ in range(n):
+        key_length, blob_length = struct.unpack_from("<HQ", blob, offset)
+        offset += struct.calcsize("<HQ")
+        name = blob[offset : offset + key_length].decode()
+        offset += key_length
+        dgms[name] = decode_diagram(blob[offset : offset + blob_length])
+        offset += blob_length
+    return dgms
@@ -1,43 +1,89 @@
 """Construct persistence diagram from a "point cloud" (represented as an array)."""
 
-from typing import Iterable, Optional, Tuple
+from typing import Dict, Iterable, Optional, Tuple, Union
 
 import diode
 import dionysus as d
 import numpy as np
 
+PRECISIONS = ("exact", "fast", "auto")
+# "auto" uses exact predicates up to this many points, beyond them the fast path. Uncalibrated:
+# how far the fast path moves diagrams has not been measured with diode yet, run
+# ``moleculetda.metrics.precision_report`` on representative structures before relying on it.
+AUTO_EXACT_MAX_POINTS = 5000
+
+
+def use_exact(precision: str, n_points: int) -> bool:
+    """
+    Whether a precision mode uses exact predicates for a point cloud.
+
+    Args:
+        precision (str): "exact", "fast" (inexact predicates) or "auto" (exact up to
+            AUTO_EXACT_MAX_POINTS points)
+        n_points (int): number of points in the point cloud
+
+    Returns:
+        True if exact alpha shapes should be used
+    """
+    if precision not in PRECISIONS:
+        raise ValueError(f'Unknown precision "{precision}", use one of {PRECISIONS}.')
+    if precision == "auto":
+        return n_points <= AUTO_EXACT_MAX_POINTS
+    return precision == "exact"
+
 
 def construct_pds(
     coords: np.ndarray,
-    exact: bool = True,
+    exact: Optional[bool] = None,
     periodic: bool = False,
     weights: Optional[Iterable] = None,
-) -> Tuple[d.Diagram]:
+    representatives: bool = False,
+    min_persistence: float = 0.0,
+    precision: Optional[str] = None,
+) -> Union[Tuple[d.Diagram, ...], Tuple[Tuple[d.Diagram, ...], Dict[str, dict]]]:
     """
     Coordinates to persistence diagrams.
     Args:
         coords (np.ndarray): point cloud represented as an array
-        exact (bool): if True, use exact alpha shapes
+        exact (bool, optional): if True, use exact alpha shapes, if False the fast path;
+            defaults to exact alpha shapes, except for unweighted periodic ones (see
+            ``get_alpha_shapes``)
         periodic (bool): if True, use periodic alpha shapes
         weights (Iterable, optional): weights for each point,
             e.g. atomic radii for each point
+        representatives (bool): if True, also return representative cycles,
+            see ``get_representatives``
+        min_persistence (float): only extract representatives of points whose persistence
+            (in the units of ``diagrams_to_arrays``) is at least this large
+        precision (str, optional): "exact", "fast" or "auto", overrides exact (see ``use_exact``)
 
     Returns:
         dgms: persistence diagram objects (dgms[0] is 0d, dgms[1] is 1d, etc.)
+        reps: representative cycles, only if representatives is True
     """
+    if precision is not None:
+        exact = use_exact(precision, len(coords))
     f = get_alpha_shapes(coords, exact, periodic=periodic, weights=weights)
     f = d.Filtration(f)
     m = get_persistence(f)
     dgms = d.init_diagrams(m, f)
+    if representatives:
+        return dgms, get_representatives(m, f, dgms, min_persistence=min_persistence)
     return dgms
 
 
 def get_alpha_shapes(
-    coords: np.ndarray, exact=True, periodic=False, weights: Optional[Iterable] = None
+    coords: np.ndarray,
+    exact: Optional[bool] = None,
+    periodic=False,
+    weights: Optional[Iterable] = None,
 ):
     """
     Args:
         coords (np.ndarray): matrix with xyz data
+        exact (bool, optional): if True, use exact predicates, if False the faster floating
+            point ones; defaults to exact predicates, except for unweighted periodic alpha
+            shapes, which have always defaulted to the (about 5x) faster path
         periodic (bool): if True, use periodic alpha shapes
         weights (Iterable, optional): weights for each point,
             e.g. atomic radii for each point
@@ -48,12 +94,14 @@ def get_alpha_shapes(
     if weights is not None:
         if len(weights) != len(coords):
             raise ValueError("weights must be the same length as coords")
+    if exact is None:
+        exact = not (periodic and weights is None)
     if periodic:
         if weights is not None:
             return diode.fill_weighted_periodic_alpha_shapes(
                 np.hstack((coords, np.array(weights).reshape(-1, 1))), exact=exact
             )
-        return diode.fill_periodic_alpha_shapes(coords, exact=False)
+        return diode.fill_periodic_alpha_shapes(coords, exact=exact)
 
     if weights is not None:
         return diode.fill_weighted_alpha_shapes(
@@ -71,3 +119,51 @@ def get_persistence(f: d.Filtration):
     """
     m = d.homology_persistence(f)
     return m
+
+
+def get_representatives(
+    m, f: d.Filtration, dgms: Tuple[d.Diagram], min_persistence: float = 0.0
+) -> Dict[str, dict]:
+    """
+    Representative cycles of the finite points of persistence diagrams, read off the reduced
+    boundary matrix: the reduced column of the simplex killing a class is a cycle of that class.
+
+    Cycles are stored per dimension in a CSR-like layout: the cycle of the j-th stored point
+    consists of the simplices ``simplices[offsets[j]:offsets[j + 1]]``, each row holding the
+    indices of the k + 1 points spanning a k-simplex. Points that never die have no
+    representative here.
+
+    Args:
+        m: reduced boundary matrix, see ``get_persistence``
+        f: filtration the matrix was computed from
+        dgms: persistence diagrams of m and f, see ``construct_pds``
+        min_persistence (float): only extract representatives of points whose persistence
+            (square root of the alpha values, as in ``diagrams_to_arrays``) is at least this large
+
+    Returns:
+        Dict where the representatives of each dimension can be accessed via 'dim1', etc.,
+        each a dict with "index" (position of the point in its diagram), "offsets" and
+        "simplices"
+    """
+    reps = {}
+    for dim, dgm in enumerate(dgms):
+        index, offsets, simplices = [], [0], []
+        for i, pt in enumerate(dgm):
+            if np.isinf(pt.death) or np.sqrt(pt.death) - np.sqrt(pt.birth) < min_persistence:
+                continue
+            cycle = [list(f[entry.index]) for entry in m[m.pair(pt.data)]]
+            index.append(i)
+            simplices.extend(cycle)
+            offsets.append(offsets[-1] + len(cycle))
+        reps[f"dim{dim}"] = {
+            "index": np.array(index, dtype=np.uint32),
+            "offsets": np.array(offsets, dtype=np.int64),
+            "simplices": np.array(simplices, dtype=np.uint32).reshape(-1, dim + 1),
+        }
+    return reps
+
+
+def cycle_points(reps: Dict[str, dict], dim: int, j: int) -> np.ndarray:
+    """Indices of the points on the j-th representative cycle of a dimension."""
+    rep = reps[f"dim{dim}"]
+    return np.unique(rep["simplices"][rep["offsets"][j] : rep["offsets"][j + 1]])
@@ -0,0 +1,84 @@
+"""Estimate the cost of computing persistence diagrams before building any alpha shapes.
+
+The estimate only needs the number of atoms and the lattice of a structure, so it is cheap
+compared to ``get_alpha_shapes`` and can be used to keep pathological inputs (e.g. small cells
+blown up into enormous supercells) away from the regular batch workers.
+"""
+
+from pathlib import Path
+from typing import NamedTuple, Optional, Union
+
+import numpy as np
+from pymatgen.core import Structure
+
+from .read_file import cubic_supercell_matrix, load_structure
+
+__all__ = ["CostEstimate", "estimate_cost", "SIMPLICES_PER_POINT", "BYTES_PER_SIMPLEX"]
+
+# a 3d Delaunay triangulation of well spread points has ~6.8 tetrahedra, ~13.5 triangles and
+# ~7.7 edges per vertex
+SIMPLICES_PER_POINT = 29
+# rough footprint of a simplex in the filtration plus its column in the reduced matrix
+BYTES_PER_SIMPLEX = 250
+
+
+class CostEstimate(NamedTuple):
+    """Order-of-magnitude cost of computing the persistence diagrams of one structure."""
+
+    n_atoms: int
+    n_points: int
+    n_simplices: int
+    memory: int
+
+
+def estimate_cost(
+    filename: Union[str, Path],
+    size: Optional[float] = None,
+    supercell: bool = False,
+    periodic: bool = False,
+    structure: Optional[Structure] = None,
+    cache_dir: Union[str, Path, None] = None,
+) -> CostEstimate:
+    """
+    Estimate the size of the point cloud and alpha complex that ``read_data`` would produce.
+
+    Periodic supercell point counts are exact. Other supercell point counts expect the atoms of
+    the box from the density of the cell, memory is accurate to an order of magnitude.
+
+    Args:
+        filename (str, Path): currently supports cif, .npy
+        size (float, optional): if creating a cubic supercell, size of the cell
+        supercell (bool): if creating a supercell, only supported by ".cif" option for now
+        periodic (bool): if creating a periodic supercell, only supported by ".cif" option for now
+        structure (Structure, optional): already parsed contents of a ".cif" file
+        cache_dir (str, Path, optional): directory persisting periodic supercell matrices,
+            see ``moleculetda.read_file.cubic_supercell_matrix``
+
+    Returns:
+        CostEstimate with the number of atoms in the file, points in the point cloud,
+        simplices in the alpha complex and the memory needed in bytes
+    """
+    filename = Path(filename)
+    if filename.suffix == ".cif":
+        if structure is None:
+            structure = load_structure(filename)
+        n_atoms = len(structure)
+        density = n_atoms / structure.volume
+        if not supercell:
+            n_points = n_atoms
+        elif size is None:
+            raise ValueError("The size of the supercell is required.")
+        elif periodic:
+            # the supercell holds one copy of the cell per unit of volume of the scaling matrix
+            matrix = cubic_supercell_matrix(structure, size, cache_dir=cache_dir)
+            n_points = n_atoms * int(round(abs(np.linalg.det(matrix))))
+        else:
+            # make_supercell keeps at most the atoms in the box (-5, size)^3
+            n_points = int(np.ceil(density * (size + 5) ** 3))
+    elif filename.suffix == ".npy":
+        n_atoms = n_points = len(np.load(filename, mmap_mode="r"))
+    else:
+        raise NotImplementedError("Other file types not implemented.")
+
+    n_simplices = SIMPLICES_PER_POINT * n_points
+    return CostEstimate(n_atoms, n_points, n_simplices, BYTES_PER_SIMPLEX * n_simplices)
@@ -0,0 +1,89 @@
+"""Canonical geometric fingerprints of point clouds, used to skip duplicate topology work.
+
+The persistence diagrams of a point cloud only depend on its geometry (and weights, if used),
+not on the order of the points, their position in space or the chemical species they belong to.
+Point clouds with equal fingerprints therefore have equal persistence diagrams.
+"""
+
+import hashlib
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Union
+
+import numpy as np
+
+from .read_file import Radii, read_data
+
+__all__ = ["geometric_fingerprint", "group_structures"]
+
+
+def geometric_fingerprint(
+    coords: np.ndarray, weights: Optional[Iterable] = None, tol: float = 1e-3
+) -> str:
+    """Translation and permutation invariant fingerprint of a (weighted) point cloud.
+
+    Points are centered on their centroid, quantized to a grid of spacing tol and sorted, so
+    clouds that only differ by a translation or the order of their points get the same
+    fingerprint. Rotated copies are not recognized, and values lying almost exactly between two
+    grid values may be quantized differently for two copies.
+
+    Args:
+        coords (np.ndarray): point cloud represented as an array
+        weights (Iterable, optional): weights for each point, included in the fingerprint
+        tol (float): quantization step for coordinates and weights
+
+    Returns:
+        hex digest identifying the point cloud
+    """
+    coords = np.asarray(coords, dtype=float)
+    columns = coords - coords.mean(axis=0)
+    if weights is not None:
+        columns = np.hstack((columns, np.asarray(weights, dtype=float).reshape(-1, 1)))
+    quantized = np.round(columns / tol).astype(np.int64)
+    # rows sorted by first column, then second, ...
+    quantized = quantized[np.lexsort(quantized.T[::-1])]
+
+    digest = hashlib.sha1(np.array(quantized.shape, dtype=np.int64).tobytes())
+    digest.update(np.ascontiguousarray(quantized).tobytes())
+    return digest.hexdigest()
+
+
+def group_structures(
+    filenames: Iterable[Union[str, Path]],
+    supercell_size=None,
+    periodic: bool = False,
+    weighted: bool = False,
+    include_weights: Optional[bool] = None,
+    tol: float = 1e-3,
+    radii: Radii = "atomic",
+) -> Dict[str, List[Union[str, Path]]]:
+    """Group structure files whose point clouds are identical.
+
+    Args:
+        filenames: Paths to structure files.
+        supercell_size: If wanting to create a cubic supercell, specify in Angstrom
+        the dimension (i.e. length/width/height).
+        periodic: If True, fingerprint the periodic supercell.
+        weighted: If True, read atomic radii as weights.
+        include_weights: If True, points with different weights are told apart;
+            defaults to weighted.
+        tol: quantization step for coordinates and weights
+        radii: Radii used as weights, see ``moleculetda.read_file.radius_table``.
+
+    Returns:
+        Dict mapping each fingerprint to the files that share it, in input order
+    """
+    include_weights = weighted if include_weights is None else include_weights
+    groups = defaultdict(list)
+    for filename in filenames:
+        coords, weights = read_data(
+            filename,
+            size=supercell_size,
+            supercell=bool(supercell_size),
+            periodic=periodic,
+            weighted=weighted,
+            radii=radii,
+        )
+        key = geometric_fingerprint(coords, weights if include_weights else None, tol=tol)
+        groups[key].append(filename)
+    return dict(groups)
@@ -29,3 +29,25 @@ def read_json(path):
 def read_pickle(path):
     with open(path, "rb") as f:
         return pickle.load(f)
+
+
+def read_jsonl(path):
+    with open(path, "r") as f:
+        for line in f:
+            # a line cut short by a crash is skipped, its item was never marked as done
+            if line.endswith("\n"):
+                yield json.loads(line)
+
+
+def dump_diagrams(dgms, path, resolution=1e-3, **kwargs):
+    from .codec import encode_diagrams
+
+    with open(path, "wb") as f:
+        f.write(encode_diagrams(dgms, resolution=resolution, **kwargs))
+
+
+def read_diagrams(path):
+    from .codec import decode_diagrams
+
+    with open(path, "rb") as f:
+        return decode_diagrams(f.read())
@@ -0,0 +1,293 @@
+"""Kernels between persistence diagrams for kernel methods (SVMs, Gaussian processes, ...).
+
+Two kernels are implemented:
+
+* the persistence scale-space kernel (Reininghaus et al., 2015)
+    k(F, G) = 1 / (8 pi sigma) sum_{p in F, q in G} exp(-|p - q|^2 / (8 sigma))
+                                                   - exp(-|p - q'|^2 / (8 sigma)),
+  where q' is q mirrored at the diagonal,
+* the persistence Fisher kernel (Le and Yamada, 2018)
+    k(F, G) = exp(-t d_FIM(F, G)),
+  where d_FIM is the Fisher information metric between Gaussian smoothings (bandwidth sigma) of
+  F and G, each completed by the diagonal projections of the other.
+
+Gram matrices are computed in blocks of diagrams, each block vectorized over all point pairs and
+the blocks spread over worker processes. The scale-space kernel can also be approximated with
+random Fourier features, which is linear instead of quadratic in the number of diagrams.
+Points are used in (birth, death) coordinates; points that never die are ignored.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Sequence
+
+import numpy as np
+from scipy import sparse
+from sklearn.base import BaseEstimator, TransformerMixin
+
+__all__ = ["scale_space_gram", "fisher_gram", "scale_space_features", "PersistenceKernel"]
+
+KERNELS = ("scale_space", "fisher")
+
+
+def _as_points(dgm) -> np.ndarray:
+    """Finite (birth, death) points of a diagram as an n x 2 float array."""
+    dgm = np.asarray(dgm)
+    if dgm.dtype.names:
+        points = np.column_stack((dgm["birth"], dgm["death"])).astype(float)
+    else:
+        points = np.asarray(dgm, dtype=float).reshape(-1, 2)
+    return points[np.isfinite(points).all(axis=1)]
+
+
+def _sq_distances(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    distances = (a**2).sum(axis=1)[:, None] + (b**2).sum(axis=1)[None, :] - 2 * a @ b.T
+    return np.maximum(distances, 0, out=distances)
+
+
+def _blocks(diagrams: List[np.ndarray], block_points: int) -> List[slice]:
+    """Consecutive ranges of diagrams with up to block_points points each (at least one diagram)."""
+    blocks, start, n_points = [], 0, 0
+    for i, dgm in enumerate(diagrams):
+        if i > start and n_points + len(dgm) > block_points:
+            blocks.append(slice(start, i))
+            start, n_points = i, 0
+        n_points += len(dgm)
+    if start < len(diagrams):
+        blocks.append(slice(start, len(diagrams)))
+    return blocks
+
+
+def _membership(diagrams: List[np.ndarray]):
+    """All points of the diagrams and a sparse (diagram x point) indicator matrix."""
+    counts = [len(dgm) for dgm in diagrams]
+    points = np.vstack(diagrams) if sum(counts) else np.zeros((0, 2))
+    rows = np.repeat(np.arange(len(diagrams)), counts)
+    indicator = sparse.csr_matrix(
+        (np.ones(len(rows)), (rows, np.arange(len(rows)))), shape=(len(diagrams), len(rows))
+    )
+    return points, indicator
+
+
+def _scale_space_block(xs: List[np.ndarray], ys: List[np.ndarray], sigma: float) -> np.ndarray:
+    p, a = _membership(xs)
+    q, b = _membership(ys)
+    k = np.exp(-_sq_distances(p, q) / (8 * sigma)) - np.exp(
+        -_sq_distances(p, q[:, ::-1]) / (8 * sigma)
+    )
+    return np.asarray(a @ (b @ k.T).T) / (8 * np.pi * sigma)
+
+
+def _fisher_pair(f: np.ndarray, g: np.ndarray, sigma: float, t: float) -> float:
+    if not len(f) and not len(g):
+        return 1.0
+    diagonal = np.array([[0.5, 0.5], [0.5, 0.5]])
+    # support of both smoothings: the points of F, G and their diagonal projections
+    theta = np.vstack((f, g @ diagonal, g, f @ diagonal))
+    gauss = np.exp(-_sq_distances(theta, theta) / (2 * sigma**2))
+    n = len(f) + len(g)
+    rho_f = gauss[:, :n].sum(axis=1)
+    rho_g = gauss[:, n:].sum(axis=1)
+    rho_f /= rho_f.sum()
+    rho_g /= rho_g.sum()
+    distance = np.arccos(np.clip(np.sqrt(rho_f * rho_g).sum(), -1, 1))
+    return np.exp(-t * distance)
+
+
+def _fisher_block(xs, ys, sigma: float, t: float) -> np.ndarray:
+    return np.array([[_fisher_pair(f, g, sigma, t) for g in ys] for f in xs]).reshape(
+        len(xs), len(ys)
+    )
+
+
+def _gram_block(task):
+    kernel, xs, ys, params = task
+    if kernel == "scale_space":
+        return _scale_space_block(xs, ys, params["sigma"])
+    return _fisher_block(xs, ys, params["sigma"], params["t"])
+
+
+def _gram(kernel, X, Y, params, n_jobs, block_points) -> np.ndarray:
+    xs = [_as_points(dgm) for dgm in X]
+    symmetric = Y is None
+    ys = xs if symmetric else [_as_points(dgm) for dgm in Y]
+    x_blocks, y_blocks = _blocks(xs, block_points), _blocks(ys, block_points)
+    pairs = [
+        (i, j)
+        for i in range(len(x_blocks))
+        for j in range(len(y_blocks))
+        if not symmetric or j >= i
+    ]
+    tasks = [(kernel, xs[x_blocks[i]], ys[y_blocks[j]], params) for i, j in pairs]
+
+    n_jobs = n_jobs if n_jobs else os.cpu_count()
+    if n_jobs == 1 or len(tasks) == 1:
+        results = [_gram_block(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            results = list(executor.map(_gram_block, tasks))
+
+    gram = np.zeros((len(xs), len(ys)))
+    for (i, j), block in zip(pairs, results):
+        gram[x_blocks[i], y_blocks[j]] = block
+        if symmetric:
+            gram[y_blocks[j], x_blocks[i]] = block.T
+    return gram
+
+
+def scale_space_gram(
+    X: Sequence,
+    Y: Optional[Sequence] = None,
+    sigma: float = 1.0,
+    n_jobs: Optional[int] = None,
+    block_points: int = 2048,
+) -> np.ndarray:
+    """Gram matrix of the persistence scale-space kernel.
+
+    Args:
+        X: persistence diagrams, as returned by ``diagrams_to_arrays`` or n x 2 (birth, death)
+        Y: second set of diagrams, defaults to X (computing only one triangle)
+        sigma: scale of the kernel
+        n_jobs: number of worker processes, defaults to the number of CPUs
+        block_points: number of points per block of diagrams, bounding the memory of each block
+            to roughly 16 * block_points^2 bytes
+
+    Returns:
+        len(X) x len(Y) Gram matrix
+    """
+    return _gram("scale_space", X, Y, {"sigma": sigma}, n_jobs, block_points)
+
+
+def fisher_gram(
+    X: Sequence,
+    Y: Optional[Sequence] = None,
+    sigma: float = 1.0,
+    t: float = 1.0,
+    n_jobs: Optional[int] = None,
+    block_points: int = 2048,
+) -> np.ndarray:
+    """Gram matrix of the persistence Fisher kernel.
+
+    Args:
+        X: persistence diagrams, as returned by ``diagrams_to_arrays`` or n x 2 (birth, death)
+        Y: second set of diagrams, defaults to X (computing only one triangle)
+        sigma: bandwidth of the Gaussian smoothing
+        t: scale of the Fisher information metric in the kernel
+        n_jobs: number of worker processes, defaults to the number of CPUs
+        block_points: number of points per block of diagrams
+
+    Returns:
+        len(X) x len(Y) Gram matrix
+    """
+    return _gram("fisher", X, Y, {"sigma": sigma, "t": t}, n_jobs, block_points)
+
+
+def scale_space_features(
+    X: Sequence, sigma: float = 1.0, n_components: int = 512, random_state=None
+) -> np.ndarray:
+    """Random Fourier features approximating the persistence scale-space kernel.
+
+    Each Gaussian in the kernel is approximated with features z(x) = sqrt(2 / D) cos(W x + b),
+    W ~ N(0, 1 / (4 sigma)), and a diagram F is mapped to
+    sqrt(1 / (16 pi sigma)) sum_{p in F} z(p) - z(p'), so that features(F) . features(G)
+    approximates k(F, G) with an error decreasing as 1 / sqrt(n_components).
+
+    Args:
+        X: persistence diagrams
+        sigma: scale of the kernel
+        n_components: number of random features D
+        random_state: seed or ``np.random.Generator``; use the same one for all diagrams that are
+            compared with each other
+
+    Returns:
+        len(X) x n_components feature matrix
+    """
+    rng = np.random.default_rng(random_state)
+    weights = rng.normal(scale=1 / np.sqrt(4 * sigma), size=(2, n_components))
+    offsets = rng.uniform(0, 2 * np.pi, n_components)
+    scale = np.sqrt(2 / n_components) / np.sqrt(16 * np.pi * sigma)
+
+    features = np.zeros((len(X), n_components))
+    for i, dgm in enumerate(X):
+        points = _as_points(dgm)
+        features[i] = (
+            np.cos(points @ weights + offsets) - np.cos(points[:, ::-1] @ weights + offsets)
+        ).sum(axis=0)
+    return features * scale
+
+
+class PersistenceKernel(BaseEstimator, TransformerMixin):
+    """Precomputed persistence kernel, e.g. for ``SVC(kernel="precomputed")``.
+
+    ``fit`` stores the training diagrams and ``transform`` returns the kernel between the given
+    diagrams and the training diagrams:
+
+        kernel = PersistenceKernel(sigma=0.5)
+        svc = SVC(kernel="precomputed").fit(kernel.fit_transform(train), labels)
+        svc.predict(kernel.transform(test))
+
+    Args:
+        kernel: "scale_space" or "fisher"
+        sigma: scale of the scale-space kernel or bandwidth of the Fisher kernel
+        t: scale of the Fisher information metric, only used by the Fisher kernel
+        n_components: if given, approximate the scale-space kernel with this many random
+            features (see ``scale_space_features``)
+        random_state: seed of the random features
+        n_jobs: number of worker processes for exact Gram matrices
+        block_points: number of points per block of diagrams
+    """
+
+    def __init__(
+        self,
+        kernel: str = "scale_space",
+        sigma: float = 1.0,
+        t: float = 1.0,
+        n_components: Optional[int] = None,
+        random_state=None,
+        n_jobs: Optional[int] = None,
+        block_points: int = 2048,
+    ):
+        self.kernel = kernel
+        self.sigma = sigma
+        self.t = t
+        self.n_components = n_components
+        self.random_state = random_state
+        self.n_jobs = n_jobs
+        self.block_points = block_points
+
+    def _features(self, X):
+        return scale_space_features(
+            X, sigma=self.sigma, n_components=self.n_components, random_state=self.random_state
+        )
+
+    def fit(self, X, y=None):
+        if self.kernel not in KERNELS:
+            raise NotImplementedError(f'Kernel "{self.kernel}" not implemented.')
+        if self.n_components and self.kernel != "scale_space":
+            raise ValueError("Random features are only implemented for the scale-space kernel.")
+        self.X_fit_ = list(X)
+        if self.n_components:
+            self.features_fit_ = self._features(self.X_fit_)
+        return self
+
+    def _gram(self, X, Y=None):
+        if self.kernel == "scale_space":
+            return scale_space_gram(
+                X, Y, sigma=self.sigma, n_jobs=self.n_jobs, block_points=self.block_points
+            )
+        return fisher_gram(
+            X, Y, sigma=self.sigma, t=self.t, n_jobs=self.n_jobs, block_points=self.block_points
+        )
+
+    def transform(self, X):
+        """Kernel between X and the training diagrams, len(X) x len(training diagrams)."""
+        if self.n_components:
+            return self._features(X) @ self.features_fit_.T
+        return self._gram(X, self.X_fit_)
+
+    def fit_transform(self, X, y=None):
+        """Fit and return the (symmetric) Gram matrix of the training diagrams."""
+        self.fit(X)
+        if self.n_components:
+            return self.features_fit_ @ self.features_fit_.T
+        return self._gram(self.X_fit_)
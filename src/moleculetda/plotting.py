@@ -1,16 +1,26 @@
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, Optional, Sequence, Tuple, Union
+
 import matplotlib.pyplot as plt
 import numpy as np
+from matplotlib.figure import Figure
+
+from .io import read_diagrams, read_json, read_jsonl
 
 
-def tick_labels(dgm, pixel_size):
+def tick_labels(dgm, pixel_size, max_birth=None, max_persistence=None):
     """Convert image units to units of the persistence diagram.
 
     Args:
         dgm: Array containing (birth, death) points, output of "structure_to_pd function.
         pixel_size: Pixel size resolution for the image (int).
+        max_birth, max_persistence: Maxima of the diagram if already known, e.g. the "maxB"
+        and "maxP" specs of the image, so that they are not recomputed.
     """
-    max_birth = np.max(dgm["birth"])
-    max_persistence = np.max(dgm["death"] - dgm["birth"])
+    if max_birth is None:
+        max_birth = np.max(dgm["birth"])
+    if max_persistence is None:
+        max_persistence = np.max(dgm["death"] - dgm["birth"])
 
     ticks = np.linspace(0, pixel_size, 6)
 
@@ -84,3 +94,248 @@ def plot_pers_images(images, arr_dgms):
     plt.tight_layout()
     plt.show()
     return None
+
+
+def _as_array(points) -> np.ndarray:
+    """(birth, death) columns of a diagram array or of a diagram read from JSON."""
+    if isinstance(points, np.ndarray) and points.dtype.names:
+        return np.column_stack((points["birth"], points["death"]))
+    if len(points) == 0:
+        return np.empty((0, 2))
+    points = np.asarray(points, dtype=float)
+    return points.reshape(len(points), -1)[:, :2]
+
+
+# suffixes picked up when walking directories, diagram archives are expected to end in ".mtd"
+RECORD_SUFFIXES = (".json", ".jsonl", ".mtd")
+IMAGE_SUFFIXES = (".npy",)
+
+
+def _iter_files(sources: Iterable[Union[str, Path]]) -> Iterator[Path]:
+    """Files of the sources, directories replaced by their files with known suffixes."""
+    for source in sources:
+        source = Path(source)
+        if source.is_dir():
+            yield from _iter_files(
+                sorted(
+                    p
+                    for p in source.iterdir()
+                    if p.is_file()
+                    and not p.name.startswith(".")
+                    and p.suffix in RECORD_SUFFIXES + IMAGE_SUFFIXES
+                )
+            )
+        else:
+            yield source
+
+
+def _read_records(path: Path) -> Iterator[dict]:
+    results: Iterable[dict]
+    if path.suffix == ".json":
+        results = [read_json(path)]
+    elif path.suffix == ".jsonl":
+        results = (record["result"] for record in read_jsonl(path))
+    else:
+        results = [{"diagrams": read_diagrams(path)}]
+    for result in results:
+        # plain diagram dicts are accepted too
+        dgms = result.get("diagrams", result)
+        record: Dict[str, Any] = {
+            "diagrams": {dim: _as_array(points) for dim, points in dgms.items()}
+        }
+        if "images" in result:
+            record["images"] = np.asarray(result["images"], dtype=float)
+        yield record
+
+
+def iter_records(sources: Iterable[Union[str, Path]]) -> Iterator[dict]:
+    """Stream the results of many structures, one at a time.
+
+    Args:
+        sources: Result files ("*_result.json"), JSON lines shards of batch runs ("*.jsonl"),
+        diagram archives written by ``moleculetda.io.dump_diagrams`` (any other suffix), or
+        directories holding any of these. In directories, only files with a suffix in
+        ``RECORD_SUFFIXES`` are read (archives need the ".mtd" suffix there). Image stores
+        (".npy") hold no diagrams and are skipped, see ``summarize``.
+
+    Returns:
+        iterator of dicts with "diagrams" (dim -> n x 2 array of (birth, death)) and, if stored,
+        "images"
+    """
+    for path in _iter_files(sources):
+        if path.suffix not in IMAGE_SUFFIXES:
+            yield from _read_records(path)
+
+
+class DiagramDensity:
+    """Streaming 2D histograms of (birth, persistence) points, per dimension.
+
+    Memory only depends on the number of bins, not on the number of points or diagrams.
+
+    Args:
+        dims: dimensions to histogram
+        bins: number of bins along birth and persistence
+        max_birth, max_persistence, min_birth: range of the histograms; points outside are
+        counted in ``n_outside``, points that never die are ignored
+    """
+
+    def __init__(
+        self,
+        dims: Sequence[int] = (0, 1, 2, 3),
+        bins: Tuple[int, int] = (200, 200),
+        max_birth: float = 18,
+        max_persistence: float = 18,
+        min_birth: float = 0,
+    ):
+        self.dims = list(dims)
+        self.bins = tuple(bins)
+        self.extent = (min_birth, max_birth, 0, max_persistence)
+        self.counts = np.zeros((len(self.dims),) + self.bins, dtype=np.int64)
+        self.n_outside = np.zeros(len(self.dims), dtype=np.int64)
+        self.n_diagrams = 0
+
+    def add(self, dgms: dict):
+        """Add the diagrams of one structure, as returned by ``structure_to_pd``."""
+        min_birth, max_birth, _, max_persistence = self.extent
+        nx, ny = self.bins
+        for k, dim in enumerate(self.dims):
+            points = _as_array(dgms.get(f"dim{dim}", np.zeros((0, 2))))
+            points = points[np.isfinite(points).all(axis=1)]
+            x = np.floor((points[:, 0] - min_birth) / (max_birth - min_birth) * nx)
+            y = np.floor((points[:, 1] - points[:, 0]) / max_persistence * ny)
+            inside = (x >= 0) & (x < nx) & (y >= 0) & (y < ny)
+            index = x[inside].astype(np.int64) * ny + y[inside].astype(np.int64)
+            self.counts[k] += np.bincount(index, minlength=nx * ny).reshape(nx, ny)
+            self.n_outside[k] += len(points) - inside.sum()
+        self.n_diagrams += 1
+
+
+class ImageMean:
+    """Streaming mean of persistence images (any shape, e.g. 4 x H x W per structure)."""
+
+    def __init__(self):
+        self.total = None
+        self.n = 0
+
+    def add(self, images: np.ndarray, batch: bool = False):
+        """Add the images of one structure, or of many if batch is True (first axis)."""
+        images = np.asarray(images, dtype=float)
+        if not batch:
+            images = images[None]
+        total = images.sum(axis=0)
+        self.total = total if self.total is None else self.total + total
+        self.n += len(images)
+
+    def add_array(self, images: Union[str, Path, np.ndarray], chunk_size: int = 256):
+        """Add a stack of images (first axis over structures), e.g. a memory-mapped ".npy"
+        feature store, reading chunk_size structures at a time."""
+        stack = images if isinstance(images, np.ndarray) else np.load(images, mmap_mode="r")
+        for start in range(0, len(stack), chunk_size):
+            self.add(stack[start : start + chunk_size], batch=True)
+
+    @property
+    def mean(self) -> np.ndarray:
+        return self.total / self.n
+
+
+def summarize(
+    sources: Iterable[Union[str, Path]], **density_kwargs
+) -> Tuple[DiagramDensity, Optional[ImageMean]]:
+    """Stream results into the density of diagram points and the mean images of a dataset.
+
+    Args:
+        sources: see ``iter_records``; image stores written by ``render_images`` (".npy") are
+        memory-mapped and added to the mean images
+        **density_kwargs: arguments of ``DiagramDensity``
+
+    Returns:
+        density of the diagram points, mean images (None if no images were stored)
+    """
+    density, mean = DiagramDensity(**density_kwargs), ImageMean()
+    for path in _iter_files(sources):
+        if path.suffix in IMAGE_SUFFIXES:
+            mean.add_array(path)
+            continue
+        for record in _read_records(path):
+            density.add(record["diagrams"])
+            if "images" in record:
+                mean.add(record["images"])
+    return density, mean if mean.n else None
+
+
+def _save(fig: Figure, path: Union[str, Path, None]) -> Figure:
+    if path is not None:
+        fig.savefig(path, dpi=150)
+    return fig
+
+
+def plot_density(
+    density: DiagramDensity, path: Union[str, Path, None] = None, log: bool = True
+) -> Figure:
+    """Plot the point densities of all dimensions side by side.
+
+    Figures are created without pyplot, so this works headless (e.g. in batch jobs).
+
+    Args:
+        density: accumulated densities, see ``summarize``
+        path: if given, the figure is saved to this file
+        log: if True, color by log10(1 + count)
+    """
+    fig = Figure(figsize=(4 * len(density.dims), 3.6))
+    axes = fig.subplots(nrows=1, ncols=len(density.dims), squeeze=False)[0]
+    for ax, dim, counts in zip(axes, density.dims, density.counts):
+        values = np.log10(1 + counts) if log else counts
+        artist = ax.imshow(
+            values.T, origin="lower", extent=density.extent, aspect="auto", cmap="viridis"
+        )
+        ax.set_xlabel("Birth")
+        ax.set_ylabel("Persistence")
+        ax.set_title(f"{dim}D, {counts.sum()} points")
+        fig.colorbar(artist, ax=ax, label="log10(1 + count)" if log else "count")
+    fig.suptitle(f"{density.n_diagrams} structures")
+    fig.tight_layout()
+    return _save(fig, path)
+
+
+def plot_mean_images(
+    mean: np.ndarray,
+    path: Union[str, Path, None] = None,
+    extent: Tuple[float, float, float, float] = (0, 18, 0, 18),
+) -> Figure:
+    """Plot mean persistence images (one per dimension), e.g. ``ImageMean.mean``.
+
+    Args:
+        mean: array of images, the last two axes are the image axes
+        path: if given, the figure is saved to this file
+        extent: (minB, maxB, 0, maxP) specs of the images, used for the axes
+    """
+    mean = np.asarray(mean).reshape((-1,) + np.shape(mean)[-2:])
+    fig = Figure(figsize=(4 * len(mean), 3.6))
+    axes = fig.subplots(nrows=1, ncols=len(mean), squeeze=False)[0]
+    for dim, (ax, image) in enumerate(zip(axes, mean)):
+        # rows of persistence images run from high to low persistence
+        artist = ax.imshow(image, extent=extent, aspect="auto", cmap=plt.cm.viridis_r)
+        ax.set_xlabel("Birth")
+        ax.set_ylabel("Persistence")
+        ax.set_title(f"Mean image {dim}")
+        fig.colorbar(artist, ax=ax)
+    fig.tight_layout()
+    return _save(fig, path)
+
+
+def plot_dataset(
+    sources: Iterable[Union[str, Path]], output_dir: Union[str, Path] = ".", **density_kwargs
+):
+    """Write density and mean image plots of a whole dataset to output_dir.
+
+    Args:
+        sources: see ``iter_records``
+        output_dir: directory for "density.png" and "mean_images.png"
+        **density_kwargs: arguments of ``DiagramDensity``
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    density, mean = summarize(sources, **density_kwargs)
+    plot_density(density, output_dir / "density.png")
+    if mean is not None:
+        plot_mean_images(mean.mean, output_dir / "mean_images.png", extent=density.extent)
@@ -1,66 +1,243 @@
 """
 Read the appropriate file type and transform accordingly to point cloud data.
 """
+
+import hashlib
+import json
+import os
+from functools import lru_cache
 from pathlib import Path
-from typing import Tuple, Union
+from typing import Dict, Mapping, Optional, Set, Tuple, Union
 
 import numpy as np
 from loguru import logger
-from pymatgen.core import Molecule, Structure
+from pymatgen.analysis.molecule_structure_comparator import CovalentRadius
+from pymatgen.core import Element, Molecule, Structure
 from pymatgen.transformations.advanced_transformations import CubicSupercellTransformation
+from pymatgen.transformations.standard_transformations import SupercellTransformation
+
+RADII = ("atomic", "covalent", "van_der_waals", "ionic")
+
+Radii = Union[str, Mapping[Union[str, int], float], np.ndarray]
+
+
+@lru_cache(maxsize=None)
+def _builtin_radius_table(kind: str) -> np.ndarray:
+    table = np.full(max(el.Z for el in Element) + 1, np.nan)
+    for el in Element:
+        if kind == "atomic":
+            radius = el.atomic_radius
+        elif kind == "covalent":
+            radius = CovalentRadius.radius.get(el.symbol)
+        elif kind == "van_der_waals":
+            radius = el.van_der_waals_radius
+        else:
+            # average_ionic_radius is 0 for elements without known ionic radii
+            radius = el.average_ionic_radius or None
+        if radius is not None:
+            table[el.Z] = float(radius)
+    table.flags.writeable = False
+    return table
+
+
+def radius_table(radii: Radii = "atomic") -> np.ndarray:
+    """
+    Lookup table from atomic number to radius, NaN for elements without a radius.
+
+    Args:
+        radii (str, Mapping, np.ndarray): one of "atomic", "covalent", "van_der_waals" or "ionic"
+            for pymatgen's radii, a mapping from element symbol or atomic number to radius,
+            or a ready-made table indexed by atomic number
+    """
+    if isinstance(radii, str):
+        if radii not in RADII:
+            raise ValueError(f"radii must be one of {RADII}, a mapping or an array.")
+        return _builtin_radius_table(radii)
+    if isinstance(radii, Mapping):
+        table = np.full(max(el.Z for el in Element) + 1, np.nan)
+        for element, radius in radii.items():
+            table[element if isinstance(element, int) else Element(element).Z] = radius
+        return table
+    return np.asarray(radii, dtype=float)
+
+
+def get_weights(atomic_numbers, radii: Radii = "atomic") -> np.ndarray:
+    """
+    Radius of each atom, looked up by atomic number.
+
+    Args:
+        atomic_numbers: atomic number of each site, e.g. ``structure.atomic_numbers``
+        radii (str, Mapping, np.ndarray): radius table, see ``radius_table``
+    """
+    atomic_numbers = np.asarray(atomic_numbers, dtype=int)
+    weights = radius_table(radii)[atomic_numbers]
+    missing = np.isnan(weights)
+    if np.any(missing):
+        symbols = sorted({Element.from_Z(z).symbol for z in atomic_numbers[missing]})
+        raise ValueError(f"No radius available for {', '.join(symbols)}.")
+    return weights
+
+
+@lru_cache(maxsize=32)
+def _parse_structure(filename: str, mtime_ns: int, file_size: int) -> Structure:
+    return Structure.from_file(filename)
+
+
+def load_structure(filename: Union[str, Path]) -> Structure:
+    """
+    Parse a structure file, reusing the result of earlier calls for an unchanged file.
+
+    Args:
+        filename (str, Path): any structure file supported by pymatgen
+
+    Returns:
+        a copy of the parsed structure, which callers are free to modify
+    """
+    stat = os.stat(filename)
+    return _parse_structure(str(Path(filename).resolve()), stat.st_mtime_ns, stat.st_size).copy()
+
+
+SUPERCELL_MATRICES_FILE = "supercell_matrices.json"
+
+_supercell_matrices: Dict[str, list] = {}
+_loaded_cache_dirs: Set[Path] = set()
+
+
+def _supercell_key(lattice_matrix: np.ndarray, min_length: float) -> str:
+    # adding 0.0 turns -0.0 into 0.0, so both hash alike
+    lattice = np.round(np.asarray(lattice_matrix, dtype=float), 4) + 0.0
+    return hashlib.sha1(lattice.tobytes() + repr(float(min_length)).encode()).hexdigest()
+
+
+def cubic_supercell_matrix(
+    structure: Structure, min_length: float, cache_dir: Union[str, Path, None] = None
+) -> np.ndarray:
+    """
+    Scaling matrix found by pymatgen's ``CubicSupercellTransformation``, memoized.
+
+    The search over supercell matrices only depends on the lattice and min_length, so its result
+    is kept in memory for the lifetime of the process and, if cache_dir is given, in a JSON file
+    in that directory shared by later runs.
+
+    Args:
+        structure (Structure): structure to build the supercell of
+        min_length (float): minimum side length of the cubic supercell
+        cache_dir (str, Path, optional): directory persisting the matrices across runs
+
+    Returns:
+        3x3 integer scaling matrix, e.g. for ``SupercellTransformation``
+    """
+    key = _supercell_key(structure.lattice.matrix, min_length)
+    path = Path(cache_dir) / SUPERCELL_MATRICES_FILE if cache_dir else None
+    if key not in _supercell_matrices and path and path not in _loaded_cache_dirs:
+        if path.exists():
+            with open(path) as f:
+                _supercell_matrices.update(json.load(f))
+        _loaded_cache_dirs.add(path)
+
+    if key not in _supercell_matrices:
+        transformation = CubicSupercellTransformation(min_length=min_length)
+        transformation.apply_transformation(structure)
+        _supercell_matrices[key] = np.asarray(transformation.transformation_matrix).tolist()
+        if path:
+            # merge with entries written by other processes in the meantime, then swap in
+            path.parent.mkdir(parents=True, exist_ok=True)
+            if path.exists():
+                with open(path) as f:
+                    _supercell_matrices.update({**json.load(f), **_supercell_matrices})
+            tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+            with open(tmp_path, "w") as f:
+                json.dump(_supercell_matrices, f)
+            os.replace(tmp_path, path)
+
+    return np.array(_supercell_matrices[key], dtype=int)
 
 
 def read_data(
     filename: Union[str, Path],
-    size: Union[Tuple[int], None] = None,
+    size: Optional[float] = None,
     supercell: bool = False,
     periodic: bool = False,
     weighted: bool = False,
+    radii: Radii = "atomic",
+    structure: Optional[Structure] = None,
+    cache_dir: Union[str, Path, None] = None,
 ) -> Tuple[np.ndarray, Union[np.ndarray, None]]:
     """
     Args:
         filename (str, Path): currently supports cif, .npy
-        size (Tuple[int], None): if creating a cubic supercell, size of the cell. Defaults to None
+        size (float, optional): if creating a cubic supercell, size of the cell. Defaults to None
         supercell (bool): if creating a supercell, only supported by ".cif" option for now
         periodic (bool): if creating a periodic supercell, only supported by ".cif" option for now
         weighted (bool): If True, use weighted alpha shapes.
             The weighting will default to atomic radii.
+        radii (str, Mapping, np.ndarray): radii used as weights, see ``radius_table``
+        structure (Structure, optional): already parsed contents of a ".cif" file, which is then
+            not read again
+        cache_dir (str, Path, optional): directory persisting periodic supercell matrices,
+            see ``cubic_supercell_matrix``
     """
     weights = None
     filename = Path(filename)
     if filename.suffix == ".cif":
-        if supercell:
-            lattice_matrix, xyz, weights = read_cif(filename, weighted=weighted)
-            if periodic:
-                s = Structure.from_file(filename)
-                supercell_structure = CubicSupercellTransformation(
-                    min_length=size
-                ).apply_transformation(s)
-                if weighted:
-                    weights = np.array([site.specie.atomic_radius for site in supercell_structure])
-                return supercell_structure.frac_coords, weights
-            if weighted:
-                coords_hstack = np.hstack((xyz, weights.reshape(-1, 1)))
-
-                coords_ = make_supercell(coords_hstack, lattice_matrix, size)
-                return coords_[:, :3], coords_[:, 3]
-            else:
-                return make_supercell(xyz, lattice_matrix, size), weights
-        else:
-            return read_cif(filename)[1]  # xyz coordinates
+        if structure is None:
+            structure = load_structure(filename)
+        coords, atomic_numbers = structure_to_points(
+            structure, size=size, supercell=supercell, periodic=periodic, cache_dir=cache_dir
+        )
+        if weighted:
+            weights = get_weights(atomic_numbers, radii)
+        return coords, weights
     elif filename.suffix == ".npy":
-        return np.load(filename)
+        return np.load(filename), None
     else:
         raise NotImplementedError("Other file types not implemented.")
 
 
+def structure_to_points(
+    structure: Structure,
+    size: Optional[float] = None,
+    supercell: bool = False,
+    periodic: bool = False,
+    cache_dir: Union[str, Path, None] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Point cloud of a parsed structure, with the atomic number of every point.
+
+    Args:
+        structure (Structure): parsed structure
+        size (float, optional): if creating a cubic supercell, size of the cell
+        supercell (bool): if creating a supercell
+        periodic (bool): if creating a periodic supercell, in which case fractional coordinates
+            are returned
+        cache_dir (str, Path, optional): directory persisting periodic supercell matrices
+
+    Returns:
+        coords: matrix with xyz data
+        atomic_numbers: atomic number of each point
+    """
+    atomic_numbers = np.array(structure.atomic_numbers)
+    if not supercell:
+        return structure.cart_coords, atomic_numbers
+    if size is None:
+        raise ValueError("The size of the supercell is required.")
+    if periodic:
+        matrix = cubic_supercell_matrix(structure, size, cache_dir=cache_dir)
+        supercell_structure = SupercellTransformation(matrix).apply_transformation(structure)
+        return supercell_structure.frac_coords, np.array(supercell_structure.atomic_numbers)
+    coords, index = make_supercell(
+        structure.cart_coords, structure.lattice.matrix, size, return_index=True
+    )
+    return coords, atomic_numbers[index]
+
+
 def read_cif(
-    filename: Union[str, Path], weighted
+    filename: Union[str, Path], weighted: bool = False, radii: Radii = "atomic"
 ) -> Tuple[np.ndarray, np.ndarray, Union[None, np.ndarray]]:
 
-    structure = Structure.from_file(filename)
+    structure = load_structure(filename)
     if weighted:
-        weights = np.array([site.specie.atomic_radius for site in structure])
+        weights = get_weights(structure.atomic_numbers, radii)
     else:
         weights = None
     lattice_matrix = structure.lattice.matrix
@@ -69,8 +246,12 @@ def read_cif(
 
 
 def make_supercell(
-    coords: np.ndarray, lattice: Tuple[float, float, float], size: float, min_size: float = -5
-) -> np.ndarray:
+    coords: np.ndarray,
+    lattice: Tuple[float, float, float],
+    size: float,
+    min_size: float = -5,
+    return_index: bool = False,
+) -> Union[np.ndarray, Tuple[np.ndarray, np.ndarray]]:
     """
     Generate cubic supercell of a given size.
 
@@ -79,9 +260,12 @@ def make_supercell(
         lattice (Tuple[float, float, float]): lattice constants of the system
         size (float): dimension size of cubic cell, e.g., 10x10x10
         min_size (float): minimum axes size to keep negative xyz coordinates from the original cell
+        return_index (bool): if True, also return the index of the original site of every point,
+            which can be used to carry per-site data such as weights or species over
 
     Returns:
         new_cell: supercell array
+        index: index into coords of each row of new_cell, only if return_index is True
     """
 
     # handle potential weights that we want to carry over but not change
@@ -110,7 +294,12 @@ def make_supercell(
     xyz_periodic_total = np.vstack(xyz_periodic_copies)
 
     # Filter out all atoms outside of the cubic box
-    new_cell = xyz_periodic_total[np.max(xyz_periodic_total[:, :3], axis=1) < size]
-    new_cell = new_cell[np.min(new_cell[:, :3], axis=1) > min_size]
+    in_box = (np.max(xyz_periodic_total[:, :3], axis=1) < size) & (
+        np.min(xyz_periodic_total[:, :3], axis=1) > min_size
+    )
+    new_cell = xyz_periodic_total[in_box]
 
+    if return_index:
+        index = np.tile(np.arange(len(coords)), len(xyz_periodic_copies))
+        return new_cell, index[in_box]
     return new_cell
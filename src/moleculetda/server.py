@@ -0,0 +1,268 @@
+"""Long-running local service computing persistence diagrams with warm worker processes.
+
+Starting a fresh interpreter for every structure reloads pymatgen, dionysus, diode, scipy and
+sklearn, which dominates the run time for small molecules. The service keeps a pool of worker
+processes that import everything once, answers requests over HTTP on localhost, and keeps recent
+results in an in-memory LRU cache keyed by the input contents and options.
+
+Endpoints (all JSON):
+    POST /diagrams  {"filename" | "cif" | "points": ..., "options": {...}}
+                    persistence diagrams, options as for ``structure_to_pd``
+    POST /result    {"filename" | "cif": ..., "options": {...}}
+                    diagrams and images, options as for ``structure_to_result``
+    GET  /status    cache statistics
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import urllib.request
+from collections import OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+import numpy as np
+from loguru import logger
+
+from .construct_pd import construct_pds
+from .io import NumpyEncoder
+from .structure_to_vectorization import structure_to_pd, structure_to_result
+from .vectorize_pds import DGM_DTYPE, diagrams_to_arrays
+
+__all__ = ["DiagramCache", "serve", "ServiceClient"]
+
+
+class DiagramCache:
+    """Thread-safe in-memory LRU cache of computed responses.
+
+    Args:
+        max_size: number of responses kept before the least recently used one is evicted.
+    """
+
+    def __init__(self, max_size: int = 1024):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._items: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            if key not in self._items:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._items.move_to_end(key)
+            return self._items[key]
+
+    def put(self, key: str, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._items),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+def _warm_up():
+    """Compute the diagrams of a tetrahedron, so that the first request does not pay for the
+    first calls into diode and dionysus."""
+    coords = np.array([[0, 0, 0], [1, 0, 0], [0, 1, 0], [0, 0, 1]], dtype=float)
+    diagrams_to_arrays(construct_pds(coords))
+
+
+def _compute(endpoint: str, source: str, value, options: dict) -> str:
+    """Run one request in a worker process and return the JSON encoded response."""
+    if source == "points":
+        coords = np.asarray(value, dtype=float)
+        weights = options.get("weights")
+        response = diagrams_to_arrays(
+            construct_pds(coords, periodic=options.get("periodic", False), weights=weights)
+        )
+        return json.dumps(response, cls=NumpyEncoder)
+
+    tmp_path = None
+    if source == "cif":
+        with tempfile.NamedTemporaryFile("w", suffix=".cif", delete=False) as f:
+            f.write(value)
+            tmp_path = value = f.name
+    try:
+        if endpoint == "diagrams":
+            response = structure_to_pd(value, options.pop("supercell_size", None), **options)
+        else:
+            response = structure_to_result(value, **options)
+    finally:
+        if tmp_path:
+            os.remove(tmp_path)
+    return json.dumps(response, cls=NumpyEncoder)
+
+
+def _cache_key(endpoint: str, source: str, value, options: dict) -> str:
+    digest = hashlib.sha256(f"{endpoint}\n{source}\n".encode())
+    if source == "filename":
+        # the contents decide the result, so edited files are recomputed
+        with open(value, "rb") as f:
+            digest.update(f.read())
+    elif source == "cif":
+        digest.update(value.encode())
+    else:
+        digest.update(np.asarray(value, dtype=float).tobytes())
+    digest.update(json.dumps(options, sort_keys=True, cls=NumpyEncoder).encode())
+    return digest.hexdigest()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # set on the subclass created in _make_server
+    executor: Executor
+    cache: DiagramCache
+
+    def _reply(self, code: int, body: str):
+        data = body.encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path != "/status":
+            return self._reply(404, json.dumps({"error": f"Unknown endpoint {self.path}"}))
+        self._reply(200, json.dumps(self.cache.stats()))
+
+    def do_POST(self):
+        endpoint = self.path.strip("/")
+        if endpoint not in ("diagrams", "result"):
+            return self._reply(404, json.dumps({"error": f"Unknown endpoint {self.path}"}))
+        try:
+            payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            sources = [s for s in ("filename", "cif", "points") if s in payload]
+            if len(sources) != 1:
+                raise ValueError('Exactly one of "filename", "cif" or "points" is required.')
+            source = sources[0]
+            if source == "points" and endpoint != "diagrams":
+                raise ValueError("Point clouds are only supported by /diagrams.")
+            value, options = payload[source], payload.get("options", {})
+            key = _cache_key(endpoint, source, value, options)
+        except Exception as e:
+            logger.exception("Bad request")
+            return self._reply(400, json.dumps({"error": repr(e)}))
+
+        try:
+            response = self.cache.get(key)
+            if response is None:
+                response = self.executor.submit(_compute, endpoint, source, value, options)
+                response = response.result()
+                self.cache.put(key, response)
+        except Exception as e:
+            logger.exception("Request failed")
+            return self._reply(500, json.dumps({"error": repr(e)}))
+        self._reply(200, response)
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} {format % args}")
+
+
+def _make_server(host: str, port: int, executor: Executor, cache: DiagramCache):
+    handler = type("Handler", (_Handler,), {"executor": executor, "cache": cache})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def serve(
+    host: str = "127.0.0.1",
+    port: int = 8765,
+    n_workers: Optional[int] = None,
+    cache_size: int = 1024,
+):
+    """Run the service until interrupted.
+
+    Args:
+        host: Address to listen on; keep it local, requests may name files on this machine.
+        port: Port to listen on.
+        n_workers: Number of warm worker processes, defaults to the number of CPUs.
+        cache_size: Number of responses kept in the LRU cache.
+    """
+    n_workers = n_workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=n_workers, initializer=_warm_up) as executor:
+        # start (and warm up) every worker now instead of on the first requests
+        for future in [executor.submit(os.getpid) for _ in range(n_workers)]:
+            future.result()
+
+        with _make_server(host, port, executor, DiagramCache(cache_size)) as server:
+            logger.info(f"Serving on http://{host}:{port} with {n_workers} workers")
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+
+
+class ServiceClient:
+    """Thin client for a running service.
+
+    Args:
+        host: Address of the service.
+        port: Port of the service.
+        timeout: Seconds to wait for a response.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 8765, timeout: float = 3600.0):
+        self.url = f"http://{host}:{port}"
+        self.timeout = timeout
+
+    def _post(self, endpoint: str, payload: dict) -> dict:
+        request = urllib.request.Request(
+            f"{self.url}/{endpoint}",
+            data=json.dumps(payload, cls=NumpyEncoder).encode(),
+            headers={"Content-Type": "application/json"},
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:  # noqa: S310
+            return json.loads(response.read())
+
+    @staticmethod
+    def _payload(filename, cif, points, options) -> dict:
+        sources = {"filename": filename, "cif": cif, "points": points}
+        payload = {k: v for k, v in sources.items() if v is not None}
+        if "filename" in payload:
+            payload["filename"] = os.path.abspath(payload["filename"])
+        payload["options"] = options
+        return payload
+
+    @staticmethod
+    def _to_arrays(dgms: dict) -> dict:
+        return {
+            dim: np.array([tuple(point) for point in points], dtype=DGM_DTYPE)
+            for dim, points in dgms.items()
+        }
+
+    def diagrams(self, filename=None, cif: Optional[str] = None, points=None, **options) -> dict:
+        """Persistence diagrams of a structure file, CIF contents or point cloud.
+
+        Returns:
+            Dict where persistence diagrams for each dimension can be accessed via 'dim1', etc.
+        """
+        payload = self._payload(filename, cif, points, options)
+        return self._to_arrays(self._post("diagrams", payload))
+
+    def result(self, filename=None, cif: Optional[str] = None, **options) -> dict:
+        """Persistence diagrams ("diagrams") and images ("images") of a structure."""
+        response = self._post("result", self._payload(filename, cif, None, options))
+        return {
+            "diagrams": self._to_arrays(response["diagrams"]),
+            "images": [np.array(image) for image in response["images"]],
+        }
+
+    def status(self) -> dict:
+        """Cache statistics of the service."""
+        url = f"{self.url}/status"
+        with urllib.request.urlopen(url, timeout=self.timeout) as response:  # noqa: S310
+            return json.loads(response.read())
@@ -1,17 +1,44 @@
 """Example going from a structure to its vectorized persistence diagrams."""
 
+import os
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import Union
+from typing import Dict, Iterable, List, Mapping, Optional, Sequence, Union
 
-from .construct_pd import construct_pds
-from .read_file import read_data
-from .vectorize_pds import PersImage, diagrams_to_arrays
+import numpy as np
+from loguru import logger
+from pymatgen.core import Element, Structure
 
-__all__ = ["structure_to_pd"]
+from .construct_pd import construct_pds, use_exact
+from .fingerprint import geometric_fingerprint
+from .read_file import Radii, get_weights, load_structure, read_data, structure_to_points
+from .tiling import construct_pds_tiled
+from .vectorize_pds import DGM_DTYPE, PersImage, diagrams_to_arrays, pd_vectorization
+
+__all__ = [
+    "structure_to_pd",
+    "structures_to_pd",
+    "structure_to_result",
+    "structure_to_channels",
+    "DEFAULT_CHANNELS",
+]
+
+# "nonmetal" covers the organic linkers of a framework
+DEFAULT_CHANNELS = {"all": None, "metal": "metal", "nonmetal": "nonmetal"}
 
 
 def structure_to_pd(
-    filename: Union[str, Path], supercell_size, periodic: bool = False, weighted: bool = False
+    filename: Union[str, Path],
+    supercell_size,
+    periodic: bool = False,
+    weighted: bool = False,
+    tile_radius: Optional[float] = None,
+    n_jobs: Optional[int] = None,
+    radii: Radii = "atomic",
+    cache_dir: Union[str, Path, None] = None,
+    representatives: bool = False,
+    min_persistence: float = 0.0,
+    precision: Optional[str] = None,
 ):
     """Convert structure file to all dimensions of persistence diagrams.
 
@@ -22,19 +49,301 @@ def structure_to_pd(
         periodic: If True, use periodic alpha shapes. In this case, we make sure to use a rectangular cell.
         weighted: If True, use weighted alpha shapes.
             The weighting will default to atomic radii.
+        tile_radius: If given, split the point cloud into overlapping tiles resolving features up
+            to this radius and compute them in parallel (see ``moleculetda.tiling``); the
+            diagrams then have a "vertex" field instead of "data".
+        n_jobs: Number of worker processes used for tiling, defaults to the number of CPUs.
+        radii: Radii used as weights: "atomic", "covalent", "van_der_waals", "ionic" or a
+            custom table (see ``moleculetda.read_file.radius_table``).
+        cache_dir: Directory persisting the periodic supercell matrices across runs
+            (see ``moleculetda.read_file.cubic_supercell_matrix``).
+        representatives: If True, also return representative cycles of the points whose
+            persistence is at least min_persistence (see ``moleculetda.construct_pd``).
+        min_persistence: Persistence threshold for representative cycles.
+        precision: "exact", "fast" or "auto" alpha shapes, chosen by the number of points
+            (see ``moleculetda.construct_pd.use_exact``). Defaults to exact alpha shapes, except
+            for unweighted periodic ones (see ``moleculetda.construct_pd.get_alpha_shapes``).
 
     Return:
         Dict where persistence diagrams for each dimension can be accessed via 'dim1', 'dim2', etc.
+        If representatives is True, a tuple of that dict and the representative cycles.
     """
-    if supercell_size:
-        coords, weights = read_data(
-            filename, size=supercell_size, supercell=True, periodic=periodic, weighted=weighted
+    coords, weights = read_data(
+        filename,
+        size=supercell_size,
+        supercell=bool(supercell_size),
+        periodic=periodic,
+        weighted=weighted,
+        radii=radii,
+        cache_dir=cache_dir,
+    )
+    if representatives:
+        if tile_radius:
+            raise ValueError("Representative cycles are not supported with tiling.")
+        dgms, reps = construct_pds(
+            coords,
+            periodic=periodic,
+            weights=weights,
+            representatives=True,
+            min_persistence=min_persistence,
+            precision=precision,
         )
-    else:
+        return diagrams_to_arrays(dgms), reps
+    return _points_to_pd(coords, weights, periodic, tile_radius, n_jobs, precision)
+
+
+def _points_to_pd(coords, weights, periodic, tile_radius, n_jobs, precision=None):
+    if tile_radius:
+        if periodic:
+            raise ValueError("Tiling is not supported for periodic alpha shapes.")
+        exact = use_exact(precision or "exact", len(coords))
+        return construct_pds_tiled(coords, tile_radius, weights=weights, exact=exact, n_jobs=n_jobs)
+
+    dgms = construct_pds(coords, periodic=periodic, weights=weights, precision=precision)
+
+    arr_dgms = diagrams_to_arrays(dgms)  # convert to array representations
+    return arr_dgms
+
+
+def structures_to_pd(
+    filenames: Iterable[Union[str, Path]],
+    supercell_size,
+    periodic: bool = False,
+    weighted: bool = False,
+    include_weights: Optional[bool] = None,
+    tile_radius: Optional[float] = None,
+    n_jobs: Optional[int] = None,
+    radii: Radii = "atomic",
+    precision: Optional[str] = None,
+) -> Dict[Union[str, Path], dict]:
+    """Convert many structure files to persistence diagrams, computing duplicates only once.
+
+    Structures are grouped by the fingerprint of their point cloud (see
+    ``moleculetda.fingerprint``), e.g. frameworks that only differ in their metal, and the
+    persistence diagrams are computed for the first structure of every group.
+
+    Args:
+        filenames: Paths to structure files.
+        supercell_size: If wanting to create a cubic supercell, specify in Angstrom
+        the dimension (i.e. length/width/height).
+        periodic: If True, use periodic alpha shapes.
+        weighted: If True, use weighted alpha shapes.
+            The weighting will default to atomic radii.
+        include_weights: If True, structures with different weights are never grouped,
+            defaults to weighted. Only set it to False for unweighted diagrams.
+        tile_radius: If given, compute the diagrams tile by tile (see ``moleculetda.tiling``).
+        n_jobs: Number of worker processes used for tiling, defaults to the number of CPUs.
+        radii: Radii used as weights, see ``structure_to_pd``.
+        precision: "exact", "fast" or "auto" alpha shapes, chosen by the number of points
+            (see ``moleculetda.construct_pd.use_exact``). Defaults to exact alpha shapes, except
+            for unweighted periodic ones (see ``moleculetda.construct_pd.get_alpha_shapes``).
+
+    Return:
+        Dict mapping each filename to its persistence diagrams, as returned by ``structure_to_pd``;
+        structures in the same group share the same dict.
+    """
+    include_weights = weighted if include_weights is None else include_weights
+    if weighted and not include_weights:
+        raise ValueError("Weighted diagrams depend on the weights, use include_weights=True.")
+
+    computed = {}
+    arr_dgms = {}
+    for filename in filenames:
         coords, weights = read_data(
-            filename, size=None, supercell=False, periodic=periodic, weighted=weighted
+            filename,
+            size=supercell_size,
+            supercell=bool(supercell_size),
+            periodic=periodic,
+            weighted=weighted,
+            radii=radii,
         )
-    dgms = construct_pds(coords, periodic=periodic, weights=weights)
+        key = geometric_fingerprint(coords, weights if include_weights else None)
+        if key not in computed:
+            computed[key] = _points_to_pd(coords, weights, periodic, tile_radius, n_jobs, precision)
+        arr_dgms[filename] = computed[key]
 
-    arr_dgms = diagrams_to_arrays(dgms)  # convert to array representations
+    logger.info(f"Computed {len(computed)} unique point clouds for {len(arr_dgms)} structures")
     return arr_dgms
+
+
+def structure_to_result(
+    filename: Union[str, Path],
+    supercell_size=None,
+    spread: float = 0.15,
+    maxB: float = 18,
+    maxP: float = 18,
+    minB: float = 0,
+    tile_radius: Optional[float] = None,
+    n_jobs: Optional[int] = None,
+    structure: Optional[Structure] = None,
+    image_method: str = "exact",
+    precision: Optional[str] = None,
+):
+    """Convert structure file to the persistence diagrams and images written by the CLI.
+
+    Args:
+        filename: Path to structure file.
+        supercell_size: If wanting to create a cubic supercell, specify in Angstrom
+        the dimension (i.e. length/width/height).
+        spread: Gaussian spread for vectorizing persistence diagram transformation.
+        maxB: Maximum birth value for persistence diagram vectorization.
+        maxP: Maximum persistence value for persistence diagram vectorization.
+        minB: Minimum birth value for persistence diagram vectorization.
+        tile_radius: If given, compute the diagrams tile by tile (see ``moleculetda.tiling``).
+        n_jobs: Number of worker processes used for tiling, defaults to the number of CPUs.
+        structure: Already parsed contents of a ".cif" file, which is then not read again.
+        image_method: "exact" or "histogram" rendering of the images, see ``PersImage``.
+        precision: "exact", "fast" or "auto" alpha shapes, chosen by the number of points
+            (see ``moleculetda.construct_pd.use_exact``). Defaults to exact alpha shapes, except
+            for unweighted periodic ones (see ``moleculetda.construct_pd.get_alpha_shapes``).
+
+    Return:
+        Dict with the persistence diagrams ("diagrams") and one image per dimension ("images").
+    """
+    coords, _ = read_data(
+        filename, size=supercell_size, supercell=bool(supercell_size), structure=structure
+    )
+
+    if tile_radius:
+        exact = use_exact(precision or "exact", len(coords))
+        np_dgms = construct_pds_tiled(coords, tile_radius, exact=exact, n_jobs=n_jobs)
+    else:
+        np_dgms = diagrams_to_arrays(construct_pds(coords, precision=precision))
+
+    images = []
+    for dim in [0, 1, 2, 3]:
+        dgm = np_dgms[f"dim{dim}"]
+        images.append(
+            pd_vectorization(
+                dgm,
+                spread=spread,
+                weighting="identity",
+                pixels=[50, 50],
+                specs={"maxB": maxB, "maxP": maxP, "minBD": minB},
+                method=image_method,
+            )
+        )
+
+    return {
+        "diagrams": np_dgms,
+        "images": images,
+    }
+
+
+def _channel_mask(atomic_numbers: np.ndarray, selection) -> np.ndarray:
+    """Points belonging to a channel: all atoms, "metal", "nonmetal" or a list of elements."""
+    if selection is None:
+        return np.ones(len(atomic_numbers), dtype=bool)
+    if isinstance(selection, str) and selection in ("metal", "nonmetal"):
+        metals = [z for z in np.unique(atomic_numbers) if Element.from_Z(int(z)).is_metal]
+        is_metal = np.isin(atomic_numbers, metals)
+        return is_metal if selection == "metal" else ~is_metal
+    if isinstance(selection, str):
+        selection = [selection]
+    return np.isin(atomic_numbers, [Element(symbol).Z for symbol in selection])
+
+
+def _channel_images(task):
+    """Persistence diagrams and images (4 x H x W) of one channel."""
+    coords, weights, periodic, precision, spread, weighting, pixels, specs = task
+    if len(coords):
+        arr_dgms = diagrams_to_arrays(
+            construct_pds(coords, periodic=periodic, weights=weights, precision=precision)
+        )
+    else:
+        arr_dgms = {f"dim{dim}": np.array([], dtype=DGM_DTYPE) for dim in range(4)}
+    images = [
+        pd_vectorization(
+            arr_dgms[f"dim{dim}"], spread=spread, weighting=weighting, pixels=pixels, specs=specs
+        )
+        for dim in [0, 1, 2, 3]
+    ]
+    return arr_dgms, np.stack(images)
+
+
+def structure_to_channels(
+    filename: Union[str, Path],
+    supercell_size,
+    channels: Optional[Mapping[str, Union[None, str, Sequence[str]]]] = None,
+    periodic: bool = False,
+    weighted: bool = False,
+    radii: Radii = "atomic",
+    spread: float = 0.15,
+    weighting: str = "identity",
+    pixels: List[int] = [50, 50],
+    specs: Optional[dict] = None,
+    n_jobs: Optional[int] = None,
+    cache_dir: Union[str, Path, None] = None,
+    precision: Optional[str] = None,
+):
+    """Convert structure file to element-resolved persistence images in a single pass.
+
+    The structure is parsed and the supercell is built once; the diagrams of every channel are
+    then computed from the points of the selected elements, one channel per process.
+
+    Args:
+        filename: Path to structure file.
+        supercell_size: If wanting to create a cubic supercell, specify in Angstrom
+        the dimension (i.e. length/width/height).
+        channels: Dict from channel name to the atoms it contains: None for all atoms,
+            "metal" or "nonmetal", or a list of element symbols. Defaults to ``DEFAULT_CHANNELS``.
+        periodic: If True, use periodic alpha shapes.
+        weighted: If True, use weighted alpha shapes.
+            The weighting will default to atomic radii.
+        radii: Radii used as weights, see ``structure_to_pd``.
+        spread: Gaussian spread.
+        weighting: Scheme for weighting points in the persistence diagram.
+        pixels: Pixel size of returned persistence image, e.g. [50, 50]
+        specs: Dictionary containing maxB, maxP, minBD, shared by all channels and dimensions
+            so that the images are comparable. Defaults to the CLI defaults (18, 18, 0).
+        n_jobs: Number of worker processes, defaults to one per channel (at most the number of CPUs).
+        cache_dir: Directory persisting the periodic supercell matrices across runs.
+        precision: "exact", "fast" or "auto" alpha shapes, chosen by the number of points of
+            each channel (see ``moleculetda.construct_pd.use_exact``). Defaults to exact alpha
+            shapes, except for unweighted periodic ones.
+
+    Return:
+        Dict with the channel names ("channels"), the persistence diagrams of each channel
+        ("diagrams") and the images as a C x 4 x H x W array ("images").
+    """
+    channels = DEFAULT_CHANNELS if channels is None else channels
+    specs = specs if specs else {"maxB": 18, "maxP": 18, "minBD": 0}
+
+    structure = load_structure(filename)
+    coords, atomic_numbers = structure_to_points(
+        structure,
+        size=supercell_size,
+        supercell=bool(supercell_size),
+        periodic=periodic,
+        cache_dir=cache_dir,
+    )
+    weights = get_weights(atomic_numbers, radii) if weighted else None
+
+    tasks = []
+    for selection in channels.values():
+        mask = _channel_mask(atomic_numbers, selection)
+        tasks.append(
+            (
+                coords[mask],
+                weights[mask] if weights is not None else None,
+                periodic,
+                precision,
+                spread,
+                weighting,
+                pixels,
+                specs,
+            )
+        )
+
+    n_jobs = min(n_jobs or os.cpu_count() or 1, len(tasks))
+    if n_jobs <= 1:
+        results = [_channel_images(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            results = list(executor.map(_channel_images, tasks))
+
+    return {
+        "channels": list(channels),
+        "diagrams": {name: arr_dgms for name, (arr_dgms, _) in zip(channels, results)},
+        "images": np.stack([images for _, images in results]),
+    }
@@ -0,0 +1,312 @@
+"""Domain-decomposed persistence diagrams for large point clouds.
+
+The point cloud is split into cubic tiles that are padded by an overlap region, and the alpha
+shape of every padded tile is computed independently in a process pool. Each simplex with an
+alpha value of at most ``max_radius**2`` is owned by the tile whose core contains its centroid.
+The 0d and 2d diagrams are computed from the owned simplices of all tiles by a global union-find
+over the edges and over the tetrahedra, respectively. The 1d diagram is computed tile by tile:
+each 1d pair is kept only by the tile owning the simplex that kills it. Pairs that die above
+``max_radius**2`` are dropped, and a single essential 0d class is kept.
+
+Why the owned simplices are right: a simplex is in the alpha complex at a value of at most
+``max_radius**2``, with a given value, depending only on the points within ``2 * R`` of its
+centroid, where ``R = sqrt(max_radius**2 + max weight)`` (``R = max_radius`` without weights).
+The overlap is ``2 * R``, so a padded tile and the whole point cloud agree on the simplices whose
+centroid is in the tile's core.
+
+Guarantee: the 0d and 2d diagrams are exactly those of ``construct_pds`` without the pairs dying
+above ``max_radius**2``, for any input, including a single connected framework. The 1d diagram is
+only exact if every connected component of the alpha complex of the whole point cloud at
+``max_radius**2`` lies inside the core of a single tile. Otherwise, 1d pairs whose cycles or
+filling chains reach beyond the core of their tile can come out with a different birth or death,
+be missing or be spurious.
+"""
+
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import dionysus as d
+import numpy as np
+from loguru import logger
+
+from .construct_pd import get_alpha_shapes, get_persistence
+
+__all__ = ["construct_pds_tiled", "tile_point_cloud", "TILED_DGM_DTYPE"]
+
+# like DGM_DTYPE, but the filtration index of the creating simplex ("data") is not defined for
+# tiled diagrams, "vertex" is the index (into coords) of the lowest vertex of that simplex instead
+TILED_DGM_DTYPE = np.dtype([("birth", "f4"), ("death", "f4"), ("vertex", "u4")])
+
+
+def _tile_of(points: np.ndarray, origin: np.ndarray, tile_size: float, shape: np.ndarray):
+    """Index of the tile whose core contains each point (boundary tiles extend outward)."""
+    keys = np.floor((points - origin) / tile_size).astype(int)
+    return np.clip(keys, 0, shape - 1)
+
+
+def tile_point_cloud(
+    coords: np.ndarray, tile_size: float, overlap: float
+) -> Tuple[List[Tuple[Tuple[int, ...], np.ndarray]], Tuple[np.ndarray, np.ndarray]]:
+    """Split a point cloud into cubic tiles padded by an overlap region.
+
+    Args:
+        coords (np.ndarray): matrix with xyz data
+        tile_size (float): edge length of the core of each tile, cores partition space
+        overlap (float): padding added on every side of a core, must not exceed tile_size
+
+    Returns:
+        tiles: list of (tile key, sorted indices of the points inside the padded tile),
+            one entry for every tile next to a non-empty core with points in its padded region
+        grid: (origin, shape) of the tile grid
+    """
+    if overlap > tile_size:
+        raise ValueError("overlap must not exceed tile_size")
+    coords = np.asarray(coords, dtype=float)
+    origin = coords.min(axis=0)
+    shape = np.maximum(np.ceil((coords.max(axis=0) - origin) / tile_size).astype(int), 1)
+
+    # group point indices by the tile that owns them
+    linear = np.ravel_multi_index(_tile_of(coords, origin, tile_size, shape).T, shape)
+    order = np.argsort(linear, kind="stable")
+    occupied, starts, counts = np.unique(linear[order], return_index=True, return_counts=True)
+    members = {int(t): order[s : s + c] for t, s, c in zip(occupied, starts, counts)}
+
+    # simplices can have their centroid in a tile without points, next to an occupied one
+    keys = set()
+    for tile in occupied:
+        center = np.array(np.unravel_index(tile, shape))
+        for offset in itertools.product((-1, 0, 1), repeat=3):
+            other = center + np.array(offset)
+            if np.all((other >= 0) & (other < shape)):
+                keys.add(tuple(int(k) for k in other))
+
+    tiles = []
+    for key in sorted(keys):
+        # the padding is at most one tile wide, so only neighbouring tiles can contribute
+        neighbours = []
+        for offset in itertools.product((-1, 0, 1), repeat=3):
+            other = np.array(key) + np.array(offset)
+            if np.all((other >= 0) & (other < shape)):
+                neighbours.append(members.get(int(np.ravel_multi_index(tuple(other), shape))))
+        candidates = np.concatenate([n for n in neighbours if n is not None])
+
+        lower = origin + np.array(key) * tile_size - overlap
+        upper = origin + (np.array(key) + 1) * tile_size + overlap
+        upper = np.where(np.array(key) == shape - 1, np.inf, upper)
+        inside = np.all((coords[candidates] >= lower) & (coords[candidates] < upper), axis=1)
+        if inside.any():
+            tiles.append((key, np.sort(candidates[inside])))
+
+    return tiles, (origin, shape)
+
+
+def _owned_simplices(simplices, points, global_index, key, origin, tile_size, shape, limit):
+    """Simplices up to limit whose centroid is in the core of the tile.
+
+    Returns:
+        (alpha values, global vertex indices sorted in each row) for dimensions 0 to 3
+    """
+    rows: List[list] = [[] for _ in range(4)]
+    for vertices, value in simplices:
+        if value <= limit:
+            rows[len(vertices) - 1].append((value, *vertices))
+    owned = []
+    for dim in range(4):
+        table = np.array(rows[dim], dtype=float).reshape(-1, dim + 2)
+        vertices = table[:, 1:].astype(int)
+        owner = _tile_of(points[vertices].mean(axis=1), origin, tile_size, shape)
+        mine = np.all(owner == np.array(key), axis=1)
+        owned.append((table[mine, 0], np.sort(global_index[vertices[mine]], axis=1)))
+    return owned
+
+
+def _tile_persistence(task):
+    """1d persistence pairs and the simplices up to max_radius**2 owned by one tile."""
+    key, points, weights, global_index, origin, shape, tile_size, max_radius, exact = task
+    simplices = get_alpha_shapes(points, exact, weights=weights)
+    f = d.Filtration(simplices)
+    m = get_persistence(f)
+    dgms = d.init_diagrams(m, f)
+
+    limit = max_radius**2
+    pairs = []
+    for pt in dgms[1] if len(dgms) > 1 else []:
+        # drops the essential classes of the tile and features above the overlap scale
+        if not pt.death <= limit:
+            continue
+        killer = points[list(f[m.pair(pt.data)])]
+        owner = _tile_of(killer.mean(axis=0, keepdims=True), origin, tile_size, shape)[0]
+        if tuple(owner) != key:
+            continue
+        pairs.append((pt.birth, pt.death, global_index[min(f[pt.data])]))
+    owned = _owned_simplices(simplices, points, global_index, key, origin, tile_size, shape, limit)
+    return pairs, owned
+
+
+def _persists(birth: float, death: float) -> bool:
+    # like dionysus, which stores alpha values in single precision, drops pairs without persistence
+    return bool(np.float32(birth) < np.float32(death))
+
+
+def _elder_merges(births: np.ndarray, ends: np.ndarray) -> List[Tuple[int, int]]:
+    """Union-find under the elder rule.
+
+    Args:
+        births: birth value of every node, each node starts as its own component
+        ends: (link, 2) array of the nodes joined by each link, in the order of the filtration
+
+    Returns:
+        (link, oldest node of the younger component) for every link merging two components
+    """
+    parent = np.arange(len(births))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    merges = []
+    for link, (a, b) in enumerate(ends.tolist()):
+        a, b = find(a), find(b)
+        if a == b:
+            continue
+        # the root of a component is its oldest node
+        if (births[a], a) < (births[b], b):
+            a, b = b, a
+        parent[a] = b
+        merges.append((link, a))
+    return merges
+
+
+def _component_pairs(n_points: int, vertices, edges) -> List[tuple]:
+    """0d pairs: connected components of the alpha complex merging up to the limit."""
+    births = np.full(n_points, np.inf)
+    births[vertices[1][:, 0]] = vertices[0]
+    order = np.argsort(edges[0], kind="stable")
+    values, ends = edges[0][order], edges[1][order]
+    pairs = [(births[node], values[link], node) for link, node in _elder_merges(births, ends)]
+    pairs = [pt for pt in pairs if _persists(pt[0], pt[1])]
+    # a single connected component survives across the whole point cloud
+    oldest = int(np.argmin(births))
+    return pairs + [(births[oldest], np.inf, oldest)]
+
+
+def _void_pairs(triangles, tetrahedra) -> List[tuple]:
+    """2d pairs: voids of the alpha complex filled up to the limit.
+
+    By duality, the voids are the components of the complement of the complex. Going down
+    from the limit, every tetrahedron leaving the complex is a new component and every
+    triangle leaving it joins its two tetrahedra. Everything above the limit, including the
+    outside of the convex hull, is one component older than all others. A void is created by the
+    triangle merging its component and dies with the component's oldest (last) tetrahedron.
+    """
+    n = len(tetrahedra[0])
+    births = np.append(-tetrahedra[0], -np.inf)
+    cofaces: Dict[Tuple[int, ...], List[int]] = {}
+    for face in range(4):
+        for i, t in enumerate(np.delete(tetrahedra[1], face, axis=1).tolist()):
+            cofaces.setdefault(tuple(t), []).append(i)
+
+    order = np.argsort(-triangles[0], kind="stable")
+    values, vertices = triangles[0][order], triangles[1][order]
+    ends = np.array(
+        [(cofaces.get(tuple(t), []) + [n, n])[:2] for t in vertices.tolist()], dtype=int
+    ).reshape(-1, 2)
+    return [
+        (values[link], -births[node], vertices[link, 0])
+        for link, node in _elder_merges(births, ends)
+        if _persists(values[link], -births[node])
+    ]
+
+
+def construct_pds_tiled(
+    coords: np.ndarray,
+    max_radius: float,
+    tile_size: Optional[float] = None,
+    weights: Optional[Iterable] = None,
+    exact: bool = True,
+    n_jobs: Optional[int] = None,
+) -> Dict[str, np.ndarray]:
+    """
+    Coordinates to persistence diagram arrays, computed tile by tile in parallel.
+
+    See the module docstring for how the diagrams compare to ``construct_pds``.
+
+    Args:
+        coords (np.ndarray): point cloud represented as an array
+        max_radius (float): largest filtration radius (same units as coords) to resolve;
+            sets the overlap between tiles
+        tile_size (float, optional): edge length of a tile core, defaults to 4 * max_radius or
+            the overlap if that is larger
+        weights (Iterable, optional): weights for each point,
+            e.g. atomic radii for each point
+        exact (bool): if True, use exact alpha shapes
+        n_jobs (int, optional): number of worker processes, defaults to the number of CPUs
+
+    Returns:
+        Dict where persistence diagrams for each dimension can be accessed via 'dim1', 'dim2', etc.
+        as arrays of ``TILED_DGM_DTYPE``: (birth, death) as in ``diagrams_to_arrays``, and the
+        index (into coords) of the lowest vertex of the simplex creating each point.
+    """
+    coords = np.asarray(coords, dtype=float)
+    if weights is not None:
+        weights = np.asarray(weights, dtype=float)
+        if len(weights) != len(coords):
+            raise ValueError("weights must be the same length as coords")
+
+    # weights enter the power distance as |x - p|^2 - w, which widens the reach of a simplex
+    max_weight = max(float(np.max(weights)), 0.0) if weights is not None else 0.0
+    overlap = 2 * np.sqrt(max_radius**2 + max_weight)
+    tile_size = tile_size if tile_size else max(4 * max_radius, overlap)
+    tiles, (origin, shape) = tile_point_cloud(coords, tile_size, overlap)
+    logger.debug(f"Split {len(coords)} points into {len(tiles)} tiles of shape {tuple(shape)}")
+
+    tasks = [
+        (
+            key,
+            coords[index],
+            weights[index] if weights is not None else None,
+            index,
+            origin,
+            shape,
+            tile_size,
+            max_radius,
+            exact,
+        )
+        for key, index in tiles
+    ]
+    n_jobs = n_jobs if n_jobs else os.cpu_count()
+    if n_jobs == 1 or len(tasks) == 1:
+        results = [_tile_persistence(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            results = list(executor.map(_tile_persistence, tasks))
+
+    # every simplex up to the limit is owned by exactly one tile
+    simplices = [
+        (
+            np.concatenate([owned[dim][0] for _, owned in results]),
+            np.concatenate([owned[dim][1] for _, owned in results]),
+        )
+        for dim in range(4)
+    ]
+    pairs = {
+        0: _component_pairs(len(coords), simplices[0], simplices[1]),
+        1: [pt for tile_pairs, _ in results for pt in tile_pairs],
+        2: _void_pairs(simplices[2], simplices[3]),
+        3: [],
+    }
+
+    dgm_arrays = {}
+    for dim in range(4):
+        values = np.array(pairs[dim], dtype=float).reshape(-1, 3)
+        dgm = np.zeros(len(values), dtype=TILED_DGM_DTYPE)
+        # like diagrams_to_arrays, negative alpha values of weighted points have no radius (NaN)
+        with np.errstate(invalid="ignore"):
+            dgm["birth"], dgm["death"] = np.sqrt(values[:, 0]), np.sqrt(values[:, 1])
+        dgm["vertex"] = values[:, 2]
+        dgm_arrays[f"dim{dim}"] = dgm
+    return dgm_arrays
@@ -1,8 +1,12 @@
 """Calls that can vectorize a PD,
  such as to be used in an ML algorithm."""
 
-import collections
-from typing import List, Tuple
+import collections.abc
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple, Union
 
 import numpy as np
 from loguru import logger
@@ -10,18 +14,22 @@ from scipy.stats import multivariate_normal as mvn
 from scipy.stats import norm
 from sklearn.base import TransformerMixin
 
-__all__ = ["diagrams_to_arrays", "PersImage", "pd_vectorization"]
+__all__ = ["DGM_DTYPE", "diagrams_to_arrays", "PersImage", "pd_vectorization", "render_images"]
+
+DGM_DTYPE = np.dtype([("birth", "f4"), ("death", "f4"), ("data", "u4")])
+
+# the histogram grid extends this many spreads beyond the image, points further out are dropped
+HISTOGRAM_PADDING = 4
 
 
 def diagrams_to_arrays(dgms):
     """Convert persistence diagram objects to persistence diagram arrays."""
-    dgm_dtype = np.dtype([("birth", "f4"), ("death", "f4"), ("data", "u4")])
     dgm_arrays = {
         f"dim{dim}": np.array(
             [(np.sqrt(dgm[i].birth), np.sqrt(dgm[i].death), dgm[i].data) for i in range(len(dgm))]
             if dgm
             else [],
-            dtype=dgm_dtype,
+            dtype=DGM_DTYPE,
         )
         for dim, dgm in enumerate(dgms)
     }
@@ -35,13 +43,19 @@ def get_images(
     weighting: str = "identity",
     pixels: List[int] = [50, 50],
     specs: List[dict] = None,
+    method: str = "exact",
 ):
     images = []
     for dim in [0, 1, 2, 3]:
         dgm = pd[f"dim{dim}"]
         images.append(
             pd_vectorization(
-                dgm, spread=spread, weighting=weighting, pixels=pixels, specs=specs[dim]
+                dgm,
+                spread=spread,
+                weighting=weighting,
+                pixels=pixels,
+                specs=specs[dim],
+                method=method,
             )
         )
     return images
@@ -62,6 +76,13 @@ class PersImage(TransformerMixin):
             }
         kernel_type: Gaussian kernel spread
         weighting_type: weighing scheme for persistence points
+        method: "exact" integrates the Gaussian of every point over every pixel, "histogram"
+        first bins the points (linearly) onto a fine grid with `oversample` bins per spread and
+        then integrates the Gaussians of the grid, separably along birth and persistence. The
+        cost of "histogram" does not grow with points x pixels; its error against "exact" is at
+        most 0.121 / oversample^2 per pixel and unit weight, plus 3.2e-5 for every point more
+        than 4 spreads outside the image.
+        oversample: number of histogram bins per spread, only used by the "histogram" method
 
     Returns:
         Vectorized persistence image
@@ -74,6 +95,8 @@ class PersImage(TransformerMixin):
         specs=None,
         kernel_type="gaussian",
         weighting_type="identity",
+        method: str = "exact",
+        oversample: int = 4,
     ):
 
         self.specs = specs
@@ -81,6 +104,10 @@ class PersImage(TransformerMixin):
         self.weighting_type = weighting_type
         self.spread = spread
         self.nx_b, self.ny_p = pixels
+        if method not in ("exact", "histogram"):
+            raise NotImplementedError('Method "{}" not implemented.'.format(method))
+        self.method = method
+        self.oversample = oversample
 
         logger.debug(
             'PersImage(pixels={}, spread={}, specs={}, kernel_type="{}", weighting_type="{}")'.format(
@@ -92,14 +119,15 @@ class PersImage(TransformerMixin):
         """Convert diagram or list of diagrams to a persistence image.
 
         Args:
-            diagrams - list (or multiple) persistence diagrams [(birth, death)]
+            diagrams - list (or multiple) persistence diagrams [(birth, death)]; points with an
+                infinite or NaN birth or death are left out
         """
         # if diagram is empty, return empty image
         if len(diagrams) == 0:
-            return np.zeros((self.nx_b, self.ny_p))
+            return np.zeros((self.ny_p, self.nx_b))
         # if first entry of first entry is not iterable, then diagrams is singular and we need to make it a list of diagrams
         try:
-            singular = not isinstance(diagrams[0][0], collections.Iterable)
+            singular = not isinstance(diagrams[0][0], collections.abc.Iterable)
         except IndexError:
             singular = False
 
@@ -109,6 +137,8 @@ class PersImage(TransformerMixin):
         dgs = [np.copy(diagram) for diagram in diagrams]
 
         landscapes = [PersImage.to_landscape(dg) for dg in dgs]
+        # points that never die or have no birth radius (weighted diagrams) have no pixel
+        landscapes = [landscape[np.isfinite(landscape).all(axis=1)] for landscape in landscapes]
 
         if not self.specs:
             max_ls = []
@@ -149,13 +179,18 @@ class PersImage(TransformerMixin):
         ys_lower = np.linspace(0, maxP, self.ny_p)
         ys_upper = np.linspace(0, maxP, self.ny_p) + dy_p
 
+        spread = self.spread if self.spread else dx_b
+        if self.method == "histogram":
+            return self._transform_histogram(
+                landscape, spread, (xs_lower, xs_upper), (ys_lower, ys_upper)
+            )
+
         weighting = self.weighting(landscape)
 
         # Define zeros
         img = np.zeros((self.nx_b, self.ny_p))
 
-        # Implement this as a `summed-area table` - it'll be way faster
-        spread = self.spread if self.spread else dx_b
+        # see _transform_histogram for a faster approximation
         for point in landscape:
             x_smooth = norm.cdf(xs_upper, point[0], spread) - norm.cdf(xs_lower, point[0], spread)
             y_smooth = norm.cdf(ys_upper, point[1], spread) - norm.cdf(ys_lower, point[1], spread)
@@ -163,6 +198,46 @@ class PersImage(TransformerMixin):
         img = img.T[::-1]
         return img
 
+    def _transform_histogram(self, landscape, spread, x_pixels, y_pixels):
+        # per axis: bin positions of the points and pixel integrals of the bin Gaussians
+        step = spread / self.oversample
+        pad = HISTOGRAM_PADDING * spread
+        axes = []
+        for values, (lower, upper) in zip(landscape.T, (x_pixels, y_pixels)):
+            centers = np.arange(lower[0] - pad, upper[-1] + pad + step, step)
+            position = (values - centers[0]) / step
+            index = np.floor(position).astype(int)
+            smooth = norm.cdf(upper, centers[:, None], spread) - norm.cdf(
+                lower, centers[:, None], spread
+            )
+            axes.append((index, position - index, len(centers), smooth))
+        (ix, tx, nx, x_smooth), (iy, ty, ny, y_smooth) = axes
+
+        # split the weight of every point between the four surrounding bins
+        weights = self._weights(landscape)
+        inside = (ix >= 0) & (ix < nx - 1) & (iy >= 0) & (iy < ny - 1)
+        ix, tx, iy, ty, weights = ix[inside], tx[inside], iy[inside], ty[inside], weights[inside]
+        hist = np.zeros(nx * ny)
+        for dx, wx in ((0, 1 - tx), (1, tx)):
+            for dy, wy in ((0, 1 - ty), (1, ty)):
+                hist += np.bincount(
+                    (ix + dx) * ny + iy + dy, weights=weights * wx * wy, minlength=nx * ny
+                )
+
+        img = x_smooth.T @ hist.reshape(nx, ny) @ y_smooth
+        return img.T[::-1]
+
+    def _weights(self, landscape):
+        """Weights of all points at once, see ``weighting``."""
+        if self.weighting_type == "identity":
+            return np.ones(len(landscape))
+        if self.weighting_type == "linear":
+            maxy = np.max(landscape[:, 1]) if len(landscape) > 0 else 1
+            return landscape[:, 1] / maxy
+        raise NotImplementedError(
+            'Weighting type "{}" not implemented.'.format(self.weighting_type)
+        )
+
     def weighting(self, landscape=None):
         """Define a weighting function,
         for stability results to hold, the function must be 0 at y=0.
@@ -217,7 +292,7 @@ class PersImage(TransformerMixin):
         return diagram
 
 
-def pd_vectorization(dgm, spread, weighting, pixels, specs=None):
+def pd_vectorization(dgm, spread, weighting, pixels, specs=None, method="exact"):
     """
     Convert persistence diagram array to a vectorized representation.
 
@@ -229,13 +304,107 @@ def pd_vectorization(dgm, spread, weighting, pixels, specs=None):
         weighting: Scheme for weighting points in the persistence diagram.
         pixels: Pixel size of returned persistence image, e.g. [50, 50]
         specs (dict): Dictionary containing maxB, maxP, minBD.
+        method (str): "exact" or the faster approximate "histogram", see ``PersImage``.
     Return:
         Vectorized representation of a persistence diagram, can be used in
         downstream tasks like machine learning, etc.
     """
 
-    pim = PersImage(spread=spread, pixels=pixels, weighting_type=weighting, specs=specs)
+    pim = PersImage(
+        spread=spread, pixels=pixels, weighting_type=weighting, specs=specs, method=method
+    )
 
     image = pim.transform([(x["birth"], x["death"]) for x in dgm])
 
     return image  # vectorized persistence image
+
+
+def _render_chunk(task):
+    """Render the images of a chunk of structures straight into the shared output array."""
+    start, chunk, target, shape, kwargs = task
+    output = np.load(target, mmap_mode="r+")
+    specs = kwargs.pop("specs")
+    for i, dgms in enumerate(chunk, start):
+        for dim in range(shape[1]):
+            output[i, dim] = pd_vectorization(dgms[f"dim{dim}"], specs=specs[dim], **kwargs)
+    output.flush()
+
+
+def render_images(
+    diagrams: Sequence[dict],
+    output: Union[str, Path, None] = None,
+    spread: float = 0.15,
+    weighting: str = "identity",
+    pixels: Tuple[int, int] = (50, 50),
+    specs=None,
+    method: str = "exact",
+    n_dims: int = 4,
+    dtype=np.float32,
+    n_jobs: Optional[int] = None,
+    chunk_size: int = 64,
+) -> np.ndarray:
+    """Render the persistence images of many structures in parallel.
+
+    The structures are split into chunks rendered by a pool of worker processes, which write
+    their images directly into one preallocated, memory-mapped N x n_dims x H x W ".npy" file:
+    output if given, else a temporary file in shared memory (/dev/shm where available), removed
+    once the images are rendered. Images are never sent back to the parent or copied, the
+    returned array maps the rendered images and frees them when it is released.
+
+    Args:
+        diagrams: persistence diagrams of each structure, as returned by ``structure_to_pd``
+        output: ".npy" file to write the images to, e.g. for collections that do not fit in memory
+        spread: Gaussian spread
+        weighting: scheme for weighting points in the persistence diagram
+        pixels: number of pixels along birth and persistence
+        specs: dict with maxB, maxP, minBD, or one per dimension; fixed specs keep the images
+            of different structures comparable
+        method: "exact" or "histogram", see ``PersImage``
+        n_dims: number of dimensions to render, starting at dim0
+        dtype: data type of the images
+        n_jobs: number of worker processes, defaults to the number of CPUs
+        chunk_size: number of structures rendered per task
+
+    Returns:
+        N x n_dims x H x W memory-mapped array of images
+    """
+    nx_b, ny_p = pixels
+    shape = (len(diagrams), n_dims, ny_p, nx_b)
+    if specs is None or isinstance(specs, dict):
+        specs = [specs] * n_dims
+    kwargs = {
+        "spread": spread,
+        "weighting": weighting,
+        "pixels": pixels,
+        "specs": specs,
+        "method": method,
+    }
+
+    if output is not None:
+        target = str(output)
+        if not target.endswith(".npy"):
+            raise ValueError('The output file needs the ".npy" suffix.')
+    else:
+        directory = "/dev/shm" if os.path.isdir("/dev/shm") else None
+        fd, target = tempfile.mkstemp(suffix=".npy", dir=directory)
+        os.close(fd)
+
+    tasks = [
+        (start, diagrams[start : start + chunk_size], target, shape, dict(kwargs))
+        for start in range(0, len(diagrams), chunk_size)
+    ]
+    try:
+        images = np.lib.format.open_memmap(target, mode="w+", dtype=dtype, shape=shape)
+        n_jobs = n_jobs if n_jobs else os.cpu_count()
+        if n_jobs == 1 or len(tasks) <= 1:
+            for task in tasks:
+                _render_chunk(task)
+        else:
+            with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+                # the results are None, consuming them re-raises errors of the workers
+                list(executor.map(_render_chunk, tasks))
+        return images
+    finally:
+        if output is None:
+            # the mapping outlives the name of the file, which is never left behind
+            os.unlink(target)
@@ -0,0 +1,173 @@
+"""Durable work queue for batch runs, backed by a single SQLite file.
+
+Several worker processes, or several nodes sharing a filesystem with working POSIX locks, can
+pull work from the same queue file. Items that are done are never handed out again, so a batch
+can be restarted at any time, and items held by a worker that died are reclaimed once their
+lease expires. Items live in lanes, so that e.g. oversized structures can be set aside for
+workers with more resources.
+"""
+
+import sqlite3
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Union
+
+__all__ = ["WorkQueue", "PENDING", "RUNNING", "DONE", "FAILED", "DEFAULT_LANE"]
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+DEFAULT_LANE = "default"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    key TEXT PRIMARY KEY,
+    lane TEXT NOT NULL DEFAULT 'default',
+    status TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    updated REAL,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS items_status ON items (lane, status);
+"""
+
+
+class WorkQueue:
+    """Work queue of string keys (e.g. structure file paths).
+
+    Args:
+        path: SQLite file holding the queue, created if it does not exist.
+        lease: seconds after the last heartbeat at which a running item is handed out again.
+        max_attempts: number of times an item is handed out before it is marked as failed.
+        timeout: seconds to wait for the database lock held by another worker.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        lease: float = 3600.0,
+        max_attempts: int = 3,
+        timeout: float = 60.0,
+    ):
+        self.path = str(path)
+        self.lease = lease
+        self.max_attempts = max_attempts
+        # autocommit mode, transactions are opened explicitly; the default rollback journal is
+        # kept because WAL needs shared memory and does not work across nodes
+        self.conn = sqlite3.connect(self.path, timeout=timeout, isolation_level=None)
+        self.conn.executescript(_SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def _transaction(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+
+    def add(self, keys: Iterable[str], lane: str = DEFAULT_LANE) -> int:
+        """Add keys to a lane of the queue, keys that are already queued keep their status.
+
+        Returns:
+            number of keys that were newly added
+        """
+        before = self.conn.total_changes
+        self._transaction()
+        try:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO items (key, lane, updated) VALUES (?, ?, ?)",
+                ((str(key), lane, time.time()) for key in keys),
+            )
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        return self.conn.total_changes - before
+
+    def claim(self, worker: str, n: int = 1, lane: str = DEFAULT_LANE) -> List[str]:
+        """Atomically hand out up to n pending (or expired) items of a lane to a worker."""
+        now = time.time()
+        self._transaction()
+        try:
+            # items whose lease expired too often most likely kill their worker
+            self.conn.execute(
+                "UPDATE items SET status = ?, error = 'lease expired' "
+                "WHERE status = ? AND updated < ? AND attempts >= ?",
+                (FAILED, RUNNING, now - self.lease, self.max_attempts),
+            )
+            keys = [
+                row[0]
+                for row in self.conn.execute(
+                    "SELECT key FROM items "
+                    "WHERE lane = ? AND (status = ? OR (status = ? AND updated < ?)) LIMIT ?",
+                    (lane, PENDING, RUNNING, now - self.lease, n),
+                )
+            ]
+            self.conn.executemany(
+                "UPDATE items SET status = ?, worker = ?, attempts = attempts + 1, updated = ? "
+                "WHERE key = ?",
+                ((RUNNING, worker, now, key) for key in keys),
+            )
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        return keys
+
+    def heartbeat(self, keys: Iterable[str]):
+        """Renew the lease of running items."""
+        self.conn.executemany(
+            "UPDATE items SET updated = ? WHERE key = ? AND status = ?",
+            ((time.time(), key, RUNNING) for key in keys),
+        )
+
+    def complete(self, keys: Iterable[str]):
+        """Mark items as done, they are skipped by every later run."""
+        self.conn.executemany(
+            "UPDATE items SET status = ?, updated = ?, error = NULL WHERE key = ?",
+            ((DONE, time.time(), key) for key in keys),
+        )
+
+    def move(self, key: str, lane: str):
+        """Put an item back on the queue in another lane."""
+        self.conn.execute(
+            "UPDATE items SET lane = ?, status = ?, attempts = 0, updated = ? WHERE key = ?",
+            (lane, PENDING, time.time(), key),
+        )
+
+    def fail(self, key: str, error: str):
+        """Mark an item as failed, recording the error."""
+        self.conn.execute(
+            "UPDATE items SET status = ?, updated = ?, error = ? WHERE key = ?",
+            (FAILED, time.time(), error, key),
+        )
+
+    def reset(self, statuses: Iterable[str] = (FAILED,)) -> int:
+        """Return items with the given statuses to the queue, e.g. to retry failures.
+
+        Returns:
+            number of items that were reset
+        """
+        statuses = list(statuses)
+        cursor = self.conn.execute(
+            "UPDATE items SET status = ?, attempts = 0, error = NULL "
+            f"WHERE status IN ({', '.join('?' * len(statuses))})",
+            [PENDING] + statuses,
+        )
+        return cursor.rowcount
+
+    def counts(self, lane: Optional[str] = None) -> Dict[str, int]:
+        """Number of items per status, in one lane or in all lanes."""
+        counts = {PENDING: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+        rows = self.conn.execute(
+            "SELECT status, COUNT(*) FROM items WHERE ? IS NULL OR lane = ? GROUP BY status",
+            (lane, lane),
+        )
+        for status, n in rows:
+            counts[status] = n
+        return counts
+
+    def failures(self) -> Dict[str, str]:
+        """Error message of each failed item."""
+        return dict(self.conn.execute("SELECT key, error FROM items WHERE status = ?", (FAILED,)))
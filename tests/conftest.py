@@ -1,7 +1,10 @@
 import os
 
+import numpy as np
 import pytest
 
+from moleculetda.vectorize_pds import DGM_DTYPE
+
 THIS_DIR = os.path.dirname(os.path.abspath(__file__))
 
 
@@ -16,3 +19,21 @@ def hkust_paths():
         os.path.join(THIS_DIR, "test_files", "HKUST-1-La.cif"),
         os.path.join(THIS_DIR, "test_files", "HKUST-1.cif"),
     ]
+
+
+@pytest.fixture()
+def random_diagram():
+    """Factory of random persistence diagrams with the dtype of ``diagrams_to_arrays``.
+
+    Births are uniform in [low, high), persistences exponential with mean ``scale`` and the
+    ``data`` field holds random integers.
+    """
+
+    def make(n, rng, low=0.0, high=10.0, scale=2.0):
+        dgm = np.zeros(n, dtype=DGM_DTYPE)
+        dgm["birth"] = rng.uniform(low, high, n)
+        dgm["death"] = dgm["birth"] + rng.exponential(scale, n)
+        dgm["data"] = rng.integers(0, 2**32 - 1, n)
+        return dgm
+
+    return make
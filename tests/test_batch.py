@@ -0,0 +1,142 @@
+import json
+import shutil
+import time
+from pathlib import Path
+
+import pytest
+
+from moleculetda import batch
+from moleculetda.batch import (
+    OVERSIZED_LANE,
+    ResourceLimitExceeded,
+    _ResultWriter,
+    _run_limited,
+    iter_results,
+    result_path,
+    run_batch,
+)
+from moleculetda.workqueue import DONE, FAILED, PENDING, WorkQueue
+
+
+def _fake_process(key, structure, options):
+    return {"directory": Path(key).parent.name, "n_sites": len(structure)}
+
+
+def _fake_tiled_process(key, structure, options):
+    return {"tile_radius": options.get("tile_radius")}
+
+
+def _sleep(seconds):
+    time.sleep(seconds)
+
+
+def _allocate(n_bytes):
+    data = bytearray(n_bytes)
+    time.sleep(5)
+    return len(data)
+
+
+def _raise(message):
+    raise ValueError(message)
+
+
+def test_run_limited():
+    """Results and errors come back from the child, runaway children are killed."""
+    assert _run_limited(sum, ([1, 2],), timeout=10) == 3
+    with pytest.raises(RuntimeError) as info:
+        _run_limited(_raise, ("boom",))
+    assert str(info.value) == "ValueError: boom"
+    with pytest.raises(ResourceLimitExceeded):
+        _run_limited(_sleep, (10,), timeout=0.5)
+    with pytest.raises(ResourceLimitExceeded):
+        _run_limited(_allocate, (400 * 2**20,), max_memory=200 * 2**20)
+
+
+@pytest.mark.parametrize("oversized", ["defer", "fail", "tile"])
+def test_oversized(tmp_path, mof_path, monkeypatch, oversized):
+    """Structures with more points than max_points are deferred, failed or tiled."""
+    monkeypatch.setattr(batch, "_process", _fake_tiled_process)
+    counts, _ = run_batch(
+        [mof_path],
+        tmp_path / "queue.db",
+        tmp_path,
+        max_points=1,
+        oversized=oversized,
+        oversized_tile_radius=7.0,
+    )
+    work_queue = WorkQueue(tmp_path / "queue.db")
+    n_oversized = work_queue.counts(OVERSIZED_LANE)[PENDING]
+    work_queue.close()
+    if oversized == "defer":
+        assert n_oversized == 1
+    elif oversized == "fail":
+        assert counts[FAILED] == 1
+    else:
+        assert [result for _, result in iter_results(tmp_path)] == [{"tile_radius": 7.0}]
+
+
+def test_tile_radius_required(tmp_path, mof_path):
+    with pytest.raises(ValueError):
+        run_batch([mof_path], tmp_path / "queue.db", tmp_path, max_points=1, oversized="tile")
+
+
+def test_same_file_names(tmp_path, mof_path, monkeypatch):
+    """Structures with the same file name in different directories get their own results."""
+    monkeypatch.setattr(batch, "_process", _fake_process)
+    filenames = []
+    for directory in ("a", "b"):
+        (tmp_path / directory).mkdir()
+        filenames.append(shutil.copy(mof_path, tmp_path / directory / "x.cif"))
+
+    counts, _ = run_batch(filenames, tmp_path / "queue.db", tmp_path / "out", prefetch=0)
+    assert counts[DONE] == 2
+    paths = [result_path(Path(f).resolve(), tmp_path / "out") for f in filenames]
+    assert paths[0] != paths[1]
+    assert all(path.exists() for path in paths)
+    results = dict(iter_results(tmp_path / "out"))
+    assert sorted(result["directory"] for result in results.values()) == ["a", "b"]
+
+
+def test_shards(tmp_path, mof_path, hkust_paths, monkeypatch):
+    """Workers reading ahead and writing shards in the background store every result once."""
+    monkeypatch.setattr(batch, "_process", _fake_process)
+    filenames = [mof_path] + hkust_paths
+    counts, stats = run_batch(
+        filenames,
+        tmp_path / "queue.db",
+        tmp_path / "out",
+        n_workers=2,
+        prefetch=2,
+        shard_size=2,
+        flush_every=1,
+    )
+    assert counts[DONE] == 3
+    assert len(stats) == 2
+    assert sum(s["done"] for s in stats) == 3
+    results = dict(iter_results(tmp_path / "out"))
+    assert sorted(results) == sorted(str(Path(f).resolve()) for f in filenames)
+    assert not list((tmp_path / "out").glob("*_result.json"))
+
+
+def test_duplicate_shard_records(tmp_path):
+    """Records appended again after a crash are yielded once, a truncated line is skipped."""
+    lines = [
+        [{"key": "a", "result": 1}, {"key": "b", "result": 1}],
+        [{"key": "b", "result": 2}, {"key": "c", "result": 2}],
+    ]
+    for i, records in enumerate(lines):
+        with open(tmp_path / f"results_w{i}_00001.jsonl", "w") as f:
+            f.writelines(json.dumps(record) + "\n" for record in records)
+    with open(tmp_path / "results_w1_00001.jsonl", "a") as f:
+        f.write('{"key": "d", "res')
+    assert list(iter_results(tmp_path)) == [("a", 1), ("b", 2), ("c", 2)]
+
+
+def test_writer_failure(tmp_path):
+    """A writer that stopped raises in the worker instead of blocking it forever."""
+    writer = _ResultWriter(tmp_path / "missing" / "queue.db", tmp_path, "w", lambda keys: None)
+    writer.start()
+    writer.join()
+    with pytest.raises(RuntimeError) as info:
+        writer.put(("a", {}))
+    assert info.value.__cause__ is writer.error is not None
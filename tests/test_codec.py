@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+
+from moleculetda.codec import decode_diagram, decode_diagrams, encode_diagram, encode_diagrams
+from moleculetda.vectorize_pds import DGM_DTYPE
+
+
+@pytest.mark.parametrize("resolution", [1e-3, 0.05])
+def test_roundtrip_error(resolution, random_diagram):
+    """Decoded points stay within the documented error and keep their data."""
+    dgm = random_diagram(1000, np.random.default_rng(0), low=-1, scale=1)
+    blob = encode_diagram(dgm, resolution=resolution)
+    decoded = decode_diagram(blob)
+    assert len(blob) < dgm.nbytes
+
+    # points are decoded sorted by birth, the data field identifies them
+    original = dgm[np.argsort(dgm["data"])]
+    decoded = decoded[np.argsort(decoded["data"])]
+    np.testing.assert_array_equal(original["data"], decoded["data"])
+    eps = 1e-5
+    assert np.abs(decoded["birth"] - original["birth"]).max() <= resolution / 2 + eps
+    pers = original["death"] - original["birth"]
+    assert np.abs(decoded["death"] - decoded["birth"] - pers).max() <= resolution / 2 + eps
+    assert np.abs(decoded["death"] - original["death"]).max() <= resolution + eps
+
+
+def test_non_finite_and_empty(random_diagram):
+    dgm = random_diagram(10, np.random.default_rng(0))
+    dgm[3] = (0.0, np.inf, 7)
+    decoded = decode_diagram(encode_diagram(dgm, keep_data=False))
+    assert decoded[-1]["death"] == np.inf and decoded[-1]["data"] == 7
+    assert np.all(decoded["data"][:-1] == 0)
+
+    empty = np.array([], dtype=DGM_DTYPE)
+    dgms = decode_diagrams(encode_diagrams({"dim0": empty, "dim1": dgm}))
+    assert list(dgms) == ["dim0", "dim1"]
+    assert len(dgms["dim0"]) == 0 and len(dgms["dim1"]) == 10
@@ -0,0 +1,61 @@
+import numpy as np
+
+from moleculetda import construct_pd
+from moleculetda.construct_pd import (
+    AUTO_EXACT_MAX_POINTS,
+    construct_pds,
+    cycle_points,
+    get_alpha_shapes,
+    use_exact,
+)
+from moleculetda.vectorize_pds import diagrams_to_arrays
+
+
+def test_representatives_of_ring():
+    """The one persistent loop of a noisy ring is represented by a cycle around the ring."""
+    rng = np.random.default_rng(0)
+    angles = np.sort(rng.uniform(0, 2 * np.pi, 40))
+    coords = np.column_stack((np.cos(angles), np.sin(angles), np.zeros(40)))
+    coords += rng.normal(scale=0.01, size=coords.shape)
+
+    dgms, reps = construct_pds(coords, representatives=True, min_persistence=0.5)
+    arrays = diagrams_to_arrays(dgms)
+    rep = reps["dim1"]
+    assert len(rep["index"]) == 1
+    point = arrays["dim1"][rep["index"][0]]
+    assert point["death"] - point["birth"] >= 0.5
+    assert len(rep["offsets"]) == 2 and rep["simplices"].shape[1] == 2
+
+    # every vertex of a 1-cycle is shared by an even number of its edges
+    vertices, counts = np.unique(rep["simplices"], return_counts=True)
+    assert np.all(counts % 2 == 0)
+    assert len(cycle_points(reps, 1, 0)) == len(vertices) > 20
+
+
+def test_precision_modes():
+    assert use_exact("exact", 10**9)
+    assert not use_exact("fast", 10)
+    assert use_exact("auto", AUTO_EXACT_MAX_POINTS)
+    assert not use_exact("auto", AUTO_EXACT_MAX_POINTS + 1)
+
+
+def test_default_precision(monkeypatch):
+    """Unweighted periodic alpha shapes keep the fast path unless exact ones are requested."""
+    calls = []
+
+    def fill(name):
+        return lambda points, exact: calls.append((name, exact)) or []
+
+    for name in ("fill_alpha_shapes", "fill_periodic_alpha_shapes", "fill_weighted_alpha_shapes"):
+        monkeypatch.setattr(construct_pd.diode, name, fill(name))
+    coords = np.zeros((4, 3))
+    get_alpha_shapes(coords)
+    get_alpha_shapes(coords, periodic=True)
+    get_alpha_shapes(coords, weights=np.ones(4))
+    construct_pds(coords, periodic=True, precision="exact")
+    assert calls == [
+        ("fill_alpha_shapes", True),
+        ("fill_periodic_alpha_shapes", False),
+        ("fill_weighted_alpha_shapes", True),
+        ("fill_periodic_alpha_shapes", True),
+    ]
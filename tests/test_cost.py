@@ -0,0 +1,29 @@
+import pytest
+
+from moleculetda.cost import estimate_cost
+from moleculetda.read_file import make_supercell, read_cif, read_data
+
+
+def test_estimate_bounds_supercell(mof_path):
+    """The estimated number of points bounds the supercell that is actually built."""
+    lattice_matrix, xyz, _ = read_cif(mof_path, weighted=False)
+    estimate = estimate_cost(mof_path)
+    assert estimate.n_points == estimate.n_atoms == len(xyz)
+
+    for size in [10, 20, 40]:
+        estimate = estimate_cost(mof_path, size=size, supercell=True)
+        assert estimate.n_points >= len(make_supercell(xyz, lattice_matrix, size))
+        assert estimate.memory > 0
+
+
+def test_estimate_requires_size(mof_path):
+    with pytest.raises(ValueError):
+        estimate_cost(mof_path, supercell=True)
+
+
+@pytest.mark.parametrize("size", [20, 30])
+def test_estimate_periodic(hkust_paths, mof_path, size):
+    """Periodic supercells are counted exactly."""
+    for path in hkust_paths + [mof_path]:
+        coords, _ = read_data(path, size=size, supercell=True, periodic=True)
+        assert estimate_cost(path, size=size, supercell=True, periodic=True).n_points == len(coords)
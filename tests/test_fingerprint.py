@@ -0,0 +1,31 @@
+import numpy as np
+
+from moleculetda.fingerprint import geometric_fingerprint, group_structures
+
+
+def test_fingerprint_invariance():
+    """Translated and permuted copies share a fingerprint, perturbed copies do not."""
+    rng = np.random.default_rng(0)
+    coords = rng.uniform(0, 10, (100, 3))
+    weights = rng.uniform(1, 2, 100)
+    order = rng.permutation(100)
+
+    key = geometric_fingerprint(coords, weights)
+    assert geometric_fingerprint(coords[order] + [1.0, -2.0, 3.5], weights[order]) == key
+    assert geometric_fingerprint(coords, weights * 1.1) != key
+    assert geometric_fingerprint(coords) != key
+
+    moved = coords.copy()
+    moved[0] += 0.1
+    assert geometric_fingerprint(moved, weights) != key
+
+
+def test_group_hkust(hkust_paths):
+    """HKUST-1 and its La analogue only differ in their weights."""
+    groups = group_structures(hkust_paths, supercell_size=10)
+    assert list(groups.values()) == [hkust_paths]
+
+    groups = group_structures(hkust_paths, supercell_size=10, weighted=True)
+    assert len(groups) == 2
+    groups = group_structures(hkust_paths, supercell_size=10, weighted=True, include_weights=False)
+    assert len(groups) == 1
@@ -0,0 +1,58 @@
+import numpy as np
+
+from moleculetda.kernels import (
+    PersistenceKernel,
+    fisher_gram,
+    scale_space_features,
+    scale_space_gram,
+)
+
+
+def _diagrams(random_diagram, n, seed=0):
+    """n x 2 (birth, death) diagrams of random sizes."""
+    rng = np.random.default_rng(seed)
+    diagrams = []
+    for size in rng.integers(0, 30, n):
+        dgm = random_diagram(size, rng, high=5, scale=1)
+        diagrams.append(np.column_stack((dgm["birth"], dgm["death"])).astype(float))
+    return diagrams
+
+
+def _scale_space(f, g, sigma):
+    d = ((f[:, None] - g[None]) ** 2).sum(-1)
+    d_mirrored = ((f[:, None] - g[None, :, ::-1]) ** 2).sum(-1)
+    return (np.exp(-d / (8 * sigma)) - np.exp(-d_mirrored / (8 * sigma))).sum() / (
+        8 * np.pi * sigma
+    )
+
+
+def test_scale_space_gram(random_diagram):
+    """Blocked, parallel Gram matrices match the pairwise definition."""
+    diagrams = _diagrams(random_diagram, 20)
+    expected = np.array([[_scale_space(f, g, 0.5) for g in diagrams] for f in diagrams])
+    np.testing.assert_allclose(
+        scale_space_gram(diagrams, sigma=0.5, block_points=50, n_jobs=2), expected, atol=1e-10
+    )
+    np.testing.assert_allclose(
+        scale_space_gram(diagrams[:5], diagrams, sigma=0.5, n_jobs=1), expected[:5], atol=1e-10
+    )
+
+    features = scale_space_features(diagrams, sigma=0.5, n_components=20000, random_state=0)
+    assert np.abs(features @ features.T - expected).max() < 0.05 * np.abs(expected).max()
+
+
+def test_fisher_gram(random_diagram):
+    diagrams = _diagrams(random_diagram, 10)
+    gram = fisher_gram(diagrams, sigma=0.5, block_points=40, n_jobs=1)
+    np.testing.assert_allclose(gram, gram.T)
+    np.testing.assert_allclose(np.diag(gram), 1, atol=1e-6)
+    assert np.all((gram > 0) & (gram <= 1 + 1e-9))
+
+
+def test_precomputed_kernel(random_diagram):
+    diagrams = _diagrams(random_diagram, 12)
+    kernel = PersistenceKernel(sigma=0.5, n_jobs=1)
+    gram = kernel.fit_transform(diagrams[:8])
+    assert gram.shape == (8, 8)
+    np.testing.assert_allclose(kernel.transform(diagrams[:3]), gram[:3])
+    assert kernel.transform(diagrams[8:]).shape == (4, 8)
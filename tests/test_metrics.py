@@ -0,0 +1,25 @@
+import numpy as np
+import pytest
+
+from moleculetda.metrics import bottleneck_distances, precision_report
+from moleculetda.vectorize_pds import DGM_DTYPE
+
+
+def test_precision_report(mof_path):
+    """One row per file with both timings and a distance per dimension, also for weights."""
+    (row,) = precision_report([mof_path], weighted=True)
+    assert row["filename"] == str(mof_path)
+    assert row["n_points"] == 128
+    assert row["time_exact"] > 0 and row["time_fast"] > 0
+    assert sorted(row["bottleneck"]) == ["dim0", "dim1", "dim2", "dim3"]
+    assert all(distance >= 0 for distance in row["bottleneck"].values())
+
+
+def test_bottleneck_distances():
+    a = {"dim1": np.array([(1.0, 3.0, 0)], dtype=DGM_DTYPE)}
+    b = {"dim1": np.array([(1.0, 3.5, 0)], dtype=DGM_DTYPE)}
+    # dionysus approximates bottleneck distances up to a relative error of 0.01
+    assert bottleneck_distances(a, b) == {"dim1": pytest.approx(0.5, rel=0.01)}
+    b["dim1"]["birth"] = np.nan
+    with pytest.raises(ValueError):
+        bottleneck_distances(a, b)
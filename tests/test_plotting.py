@@ -0,0 +1,44 @@
+import numpy as np
+
+from moleculetda.io import dump_diagrams, dump_json
+from moleculetda.plotting import plot_dataset, summarize
+
+
+def test_summarize_results(tmp_path, random_diagram):
+    """Points of result files and diagram archives are all binned, images are averaged."""
+    rng = np.random.default_rng(0)
+    for i in range(3):
+        result = {
+            "diagrams": {f"dim{dim}": random_diagram(100, rng) for dim in range(4)},
+            "images": np.full((4, 50, 50), i),
+        }
+        dump_json(result, tmp_path / f"s{i}_result.json")
+    dump_diagrams({f"dim{dim}": random_diagram(70, rng) for dim in range(4)}, tmp_path / "a.mtd")
+
+    density, mean = summarize([tmp_path], bins=(40, 40), max_birth=50, max_persistence=50)
+    assert density.n_diagrams == 4
+    np.testing.assert_array_equal(density.counts.sum(axis=(1, 2)), 370)
+    assert mean.n == 3
+    np.testing.assert_allclose(mean.mean, 1)
+
+    plot_dataset([tmp_path], tmp_path / "plots")
+    assert (tmp_path / "plots" / "density.png").exists()
+    assert (tmp_path / "plots" / "mean_images.png").exists()
+
+
+def test_summarize_mixed_sources(tmp_path, random_diagram):
+    """Empty dimensions, image stores and a directory holding previous plots."""
+    rng = np.random.default_rng(1)
+    dump_json(
+        {"diagrams": {"dim0": random_diagram(5, rng), "dim1": []}}, tmp_path / "empty_result.json"
+    )
+    np.save(tmp_path / "images.npy", np.ones((6, 4, 10, 10), dtype=np.float32))
+    plot_dataset([tmp_path], tmp_path)
+    assert (tmp_path / "density.png").exists()
+
+    density, mean = summarize([tmp_path], bins=(10, 10), max_birth=50, max_persistence=50)
+    assert density.n_diagrams == 1
+    np.testing.assert_array_equal(density.counts.sum(axis=(1, 2)), [5, 0, 0, 0])
+    assert mean.n == 6
+    assert mean.mean.shape == (4, 10, 10)
+    np.testing.assert_allclose(mean.mean, 1)
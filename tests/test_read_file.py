@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+from pymatgen.core import Structure
+
+from moleculetda.read_file import get_weights, make_supercell, radius_table, read_data
+
+
+def test_radius_tables(mof_path):
+    """Weights are looked up by atomic number in the selected table."""
+    structure = Structure.from_file(mof_path)
+    expected = [site.specie.atomic_radius for site in structure]
+    assert get_weights(structure.atomic_numbers) == pytest.approx(expected)
+
+    custom = {el.symbol: 1.0 + i for i, el in enumerate(structure.composition.elements)}
+    weights = get_weights(structure.atomic_numbers, custom)
+    assert weights == pytest.approx([custom[site.specie.symbol] for site in structure])
+    assert radius_table({6: 2.0})[6] == 2.0
+
+    with pytest.raises(ValueError):
+        get_weights([6, 7], {"C": 1.0})
+    with pytest.raises(ValueError):
+        radius_table("unknown")
+
+
+def test_supercell_index(mof_path):
+    """Weights carried over by index match the supercell of hstacked weights."""
+    _, weights = read_data(mof_path, weighted=True, radii="van_der_waals")
+    coords, supercell_weights = read_data(
+        mof_path, size=10, supercell=True, weighted=True, radii="van_der_waals"
+    )
+    structure = Structure.from_file(mof_path)
+    hstacked = make_supercell(
+        np.hstack((structure.cart_coords, weights.reshape(-1, 1))), structure.lattice.matrix, 10
+    )
+    assert coords == pytest.approx(hstacked[:, :3])
+    assert supercell_weights == pytest.approx(hstacked[:, 3])
+
+
+def test_supercell_matrix_cache(mof_path, tmp_path, monkeypatch):
+    """Supercell matrices are persisted and reused instead of searched again."""
+    from moleculetda import read_file
+
+    coords, _ = read_data(mof_path, size=10, supercell=True, periodic=True, cache_dir=tmp_path)
+    assert (tmp_path / read_file.SUPERCELL_MATRICES_FILE).exists()
+
+    read_file._supercell_matrices.clear()
+    read_file._loaded_cache_dirs.clear()
+
+    def fail(*args, **kwargs):
+        raise AssertionError("supercell search should have been cached")
+
+    monkeypatch.setattr(read_file.CubicSupercellTransformation, "apply_transformation", fail)
+    cached, weights = read_data(
+        mof_path, size=10, supercell=True, periodic=True, weighted=True, cache_dir=tmp_path
+    )
+    assert cached == pytest.approx(coords)
+    assert len(weights) == len(cached)
@@ -0,0 +1,61 @@
+import threading
+import urllib.error
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from moleculetda import server
+from moleculetda.server import DiagramCache, ServiceClient
+
+Point = namedtuple("Point", ["birth", "death", "data"])
+
+
+def test_cache_evicts_least_recently_used():
+    cache = DiagramCache(max_size=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats() == {"size": 2, "max_size": 2, "hits": 3, "misses": 1}
+
+
+@pytest.fixture()
+def service(monkeypatch):
+    calls = []
+
+    def construct_pds(coords, periodic=False, weights=None):
+        calls.append(len(coords))
+        if len(coords) < 2:
+            raise RuntimeError("too few points")
+        return [[Point(1.0, 4.0, 0)], []]
+
+    monkeypatch.setattr(server, "construct_pds", construct_pds)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        with server._make_server("127.0.0.1", 0, executor, DiagramCache()) as httpd:
+            thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+            thread.start()
+            yield ServiceClient(port=httpd.server_address[1], timeout=10), calls
+            httpd.shutdown()
+
+
+def test_diagrams_endpoint(service):
+    """Repeated requests are answered from the cache, errors map to 400 and 500."""
+    client, calls = service
+    points = [[0, 0, 0], [1, 0, 0]]
+    for _ in range(2):
+        dgms = client.diagrams(points=points)
+        assert dgms["dim0"]["death"][0] == 2.0
+        assert len(dgms["dim1"]) == 0
+    assert calls == [2]
+    assert client.status()["hits"] == 1
+
+    with pytest.raises(urllib.error.HTTPError) as info:
+        client.diagrams(points=[[0, 0, 0]])
+    assert info.value.code == 500
+    with pytest.raises(urllib.error.HTTPError) as info:
+        client._post("result", {"points": points})
+    assert info.value.code == 400
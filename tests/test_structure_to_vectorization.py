@@ -0,0 +1,24 @@
+from moleculetda import structure_to_vectorization
+from moleculetda.structure_to_vectorization import structure_to_channels
+
+
+def test_channels(mof_path, monkeypatch):
+    """One 4 x H x W stack per channel, zero images for a channel without atoms."""
+    precisions = []
+    construct_pds = structure_to_vectorization.construct_pds
+
+    def recording_construct_pds(coords, **kwargs):
+        precisions.append(kwargs["precision"])
+        return construct_pds(coords, **kwargs)
+
+    monkeypatch.setattr(structure_to_vectorization, "construct_pds", recording_construct_pds)
+    channels = {"all": None, "metal": "metal", "xenon": ["Xe"]}
+    result = structure_to_channels(
+        mof_path, None, channels=channels, pixels=[10, 10], n_jobs=1, precision="fast"
+    )
+    assert result["channels"] == list(channels)
+    assert result["images"].shape == (3, 4, 10, 10)
+    assert precisions == ["fast", "fast"]
+    assert result["images"][0].any()
+    assert not result["images"][2].any()
+    assert all(len(dgm) == 0 for dgm in result["diagrams"]["xenon"].values())
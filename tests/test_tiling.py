@@ -0,0 +1,86 @@
+import numpy as np
+
+from moleculetda.construct_pd import construct_pds
+from moleculetda.tiling import construct_pds_tiled, tile_point_cloud
+from moleculetda.vectorize_pds import diagrams_to_arrays
+
+
+def test_tiles_cover_point_cloud():
+    """Every point is in the padded tile that owns it, and cores partition the cloud."""
+    coords = np.random.default_rng(0).uniform(0, 30, (2000, 3))
+    tiles, (origin, shape) = tile_point_cloud(coords, tile_size=8.0, overlap=4.0)
+    assert tuple(shape) == (4, 4, 4)
+
+    owned = []
+    for key, index in tiles:
+        core = np.all(np.floor((coords[index] - origin) / 8.0).clip(0, shape - 1) == key, axis=1)
+        owned.append(index[core])
+        lower = origin + np.array(key) * 8.0 - 4.0
+        assert np.all(coords[index] >= lower)
+    owned = np.concatenate(owned)
+    assert len(owned) == len(coords)
+    assert len(np.unique(owned)) == len(coords)
+
+
+def _clusters():
+    """A ring and two noisy spheres, further apart than 2 * max_radius, plus a lone point."""
+    rng = np.random.default_rng(1)
+    angles = np.linspace(0, 2 * np.pi, 16, endpoint=False)
+    ring = np.column_stack((np.cos(angles), np.sin(angles), np.zeros(16)))
+    spheres = []
+    for _ in range(2):
+        directions = rng.normal(size=(60, 3))
+        spheres.append(directions / np.linalg.norm(directions, axis=1, keepdims=True))
+    centers = [(3, 3, 3), (9, 3, 3), (15, 3, 3)]
+    parts = [np.zeros((1, 3))] + [c + p for c, p in zip(centers, [ring] + spheres)]
+    return np.vstack(parts) + rng.normal(scale=0.02, size=(1 + 16 + 120, 3))
+
+
+def _sorted_pairs(dgm):
+    pairs = np.column_stack((dgm["birth"], dgm["death"]))
+    return pairs[np.lexsort((pairs[:, 1], pairs[:, 0]))]
+
+
+def test_tiled_matches_construct_pds():
+    """Exact when every component of the alpha complex at max_radius fits in one core."""
+    coords = _clusters()
+    max_radius = 1.5
+    tiled = construct_pds_tiled(coords, max_radius, tile_size=6.0, n_jobs=1)
+    full = diagrams_to_arrays(construct_pds(coords))
+    for dim in range(3):
+        expected = full[f"dim{dim}"][full[f"dim{dim}"]["death"] <= max_radius]
+        got = tiled[f"dim{dim}"][np.isfinite(tiled[f"dim{dim}"]["death"])]
+        assert len(got) == len(expected)
+        np.testing.assert_allclose(_sorted_pairs(got), _sorted_pairs(expected), rtol=1e-5)
+    assert len(tiled["dim1"]) and len(tiled["dim2"])
+
+
+def _assert_matches(tiled, full, max_radius, dims):
+    for dim in dims:
+        expected = full[f"dim{dim}"][full[f"dim{dim}"]["death"] <= max_radius]
+        got = tiled[f"dim{dim}"][np.isfinite(tiled[f"dim{dim}"]["death"])]
+        assert len(got) == len(expected)
+        np.testing.assert_allclose(
+            _sorted_pairs(got), _sorted_pairs(expected), rtol=1e-5, equal_nan=True
+        )
+
+
+def test_tiled_connected_components_and_voids():
+    """0d and 2d diagrams are exact for a point cloud that is one connected component."""
+    coords = np.random.default_rng(2).uniform(0, 12, (700, 3))
+    max_radius = 1.5
+    tiled = construct_pds_tiled(coords, max_radius, tile_size=4.0, n_jobs=2)
+    # all points are connected below max_radius, across all 27 tiles
+    assert np.sum(np.isfinite(tiled["dim0"]["death"])) == len(coords) - 1
+    assert np.sum(np.isinf(tiled["dim0"]["death"])) == 1
+    _assert_matches(tiled, diagrams_to_arrays(construct_pds(coords)), max_radius, [0, 2])
+    assert len(tiled["dim2"])
+
+
+def test_tiled_weighted_default_tile_size():
+    """The default tile size grows with the weights, which widen the overlap."""
+    coords = np.random.default_rng(3).uniform(0, 10, (300, 3))
+    weights = np.full(len(coords), 1.5)
+    tiled = construct_pds_tiled(coords, 0.5, weights=weights, n_jobs=1)
+    full = diagrams_to_arrays(construct_pds(coords, weights=weights))
+    _assert_matches(tiled, full, 0.5, [0, 2])
@@ -0,0 +1,71 @@
+import os
+import warnings
+
+import numpy as np
+import pytest
+
+from moleculetda.vectorize_pds import PersImage, pd_vectorization, render_images
+
+
+@pytest.mark.parametrize("weighting", ["identity", "linear"])
+def test_histogram_images(weighting, random_diagram):
+    """Histogram images stay within the documented error of exact images."""
+    dgm = random_diagram(500, np.random.default_rng(0), high=17, scale=3)
+    specs = {"maxB": 18, "maxP": 18, "minBD": 0}
+
+    exact = pd_vectorization(dgm, 0.15, weighting, [50, 40], specs)
+    histogram = pd_vectorization(dgm, 0.15, weighting, [50, 40], specs, method="histogram")
+    assert histogram.shape == exact.shape == (40, 50)
+    bound = 0.121 / 4**2 * pd_vectorization(dgm, 0.15, weighting, [1, 1], specs).sum()
+    assert np.abs(histogram - exact).max() <= bound
+
+    finer = PersImage(
+        pixels=(50, 40),
+        spread=0.15,
+        specs=specs,
+        weighting_type=weighting,
+        method="histogram",
+        oversample=16,
+    ).transform([(x["birth"], x["death"]) for x in dgm])
+    assert np.abs(finer - exact).max() < np.abs(histogram - exact).max()
+
+
+@pytest.mark.parametrize("method", ["exact", "histogram"])
+def test_non_finite_points(method, random_diagram):
+    """Points that never die or have a NaN birth are left out by both methods, silently."""
+    dgm = random_diagram(50, np.random.default_rng(2))
+    finite = pd_vectorization(dgm, 0.15, "linear", [20, 20], method=method)
+    dgm = np.concatenate((dgm, dgm[:2]))
+    dgm[-2]["death"], dgm[-1]["birth"] = np.inf, np.nan
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        image = pd_vectorization(dgm, 0.15, "linear", [20, 20], method=method)
+    np.testing.assert_allclose(image, finite)
+
+
+def test_render_images(tmp_path, random_diagram):
+    """Parallel rendering into shared memory or a memory-mapped file matches serial images."""
+    rng = np.random.default_rng(1)
+    diagrams = []
+    for _ in range(10):
+        diagrams.append({f"dim{dim}": random_diagram(rng.integers(0, 20), rng) for dim in range(4)})
+    specs = {"maxB": 18, "maxP": 18, "minBD": 0}
+    expected = np.array(
+        [
+            [
+                pd_vectorization(dgms[f"dim{dim}"], 0.15, "identity", [20, 10], specs)
+                for dim in range(4)
+            ]
+            for dgms in diagrams
+        ]
+    )
+
+    images = render_images(diagrams, pixels=(20, 10), specs=specs, n_jobs=2, chunk_size=3)
+    assert images.shape == (10, 4, 10, 20)
+    # the images are not copied out of the file they were rendered to, which is already removed
+    assert isinstance(images, np.memmap) and not os.path.exists(images.filename)
+    np.testing.assert_allclose(images, expected, atol=1e-6)
+
+    path = tmp_path / "images.npy"
+    render_images(diagrams, path, pixels=(20, 10), specs=specs, n_jobs=2, chunk_size=4)
+    np.testing.assert_allclose(np.load(path), expected, atol=1e-6)
@@ -0,0 +1,27 @@
+from moleculetda.workqueue import DONE, FAILED, PENDING, RUNNING, WorkQueue
+
+
+def test_queue_resumes_and_reclaims(tmp_path):
+    """Done items are never handed out again, expired leases are reclaimed."""
+    queue = WorkQueue(tmp_path / "queue.db", lease=0.0, max_attempts=2)
+    assert queue.add(["a", "b", "c"]) == 3
+    assert queue.add(["a", "d"]) == 1
+
+    claimed = queue.claim("w1", n=2)
+    assert len(claimed) == 2
+    queue.complete(claimed[:1])
+    queue.fail(claimed[1], "error")
+    assert queue.counts() == {PENDING: 2, RUNNING: 0, DONE: 1, FAILED: 1}
+
+    # a second queue on the same file sees the same state, e.g. after a restart
+    restarted = WorkQueue(tmp_path / "queue.db", lease=0.0, max_attempts=2)
+    remaining = restarted.claim("w2", n=10)
+    assert sorted(remaining) == sorted(set("abcd") - set(claimed))
+    # leases of 0s expire immediately, so the items are handed out once more
+    assert sorted(restarted.claim("w3", n=10)) == sorted(remaining)
+    # and fail once they have been handed out max_attempts times
+    assert restarted.claim("w4", n=10) == []
+    assert restarted.counts()[FAILED] == 3
+
+    assert restarted.reset() == 3
+    assert restarted.counts()[PENDING] == 3